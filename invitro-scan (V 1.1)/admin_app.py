@@ -3,21 +3,10 @@ from tkinter import messagebox, simpledialog
 import subprocess
 import sys
 import json
-from pathlib import Path
 
-# ================= BASE DIR (EXE SAFE) =================
-def app_base_dir():
-    if getattr(sys, "frozen", False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent
-
-BASE_DIR = app_base_dir()
+from event_registry import BASE_DIR, load_events, save_events
 
 # ================= PATHS =================
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(exist_ok=True)
-
-EVENTS_FILE = DATA_DIR / "events.json"
 SETTINGS_FILE = BASE_DIR / "settings.json"
 
 # ================= DEFAULT SETTINGS =================
@@ -44,20 +33,6 @@ def save_settings(data):
     with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2)
 
-# ================= EVENT HELPERS =================
-def load_events():
-    if not EVENTS_FILE.exists():
-        data = {"active": None, "events": {}}
-        save_events(data)
-        return data
-
-    with open(EVENTS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_events(data):
-    with open(EVENTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
 # ================= ADMIN APP =================
 class AdminApp(tk.Tk):
     def __init__(self):
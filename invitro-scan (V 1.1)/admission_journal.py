@@ -0,0 +1,232 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# ================= CONFIG =================
+GROUP_SIZE = 64            # fsync as soon as this many admissions are queued
+FSYNC_INTERVAL = 0.005     # ... or after this many seconds
+MERGE_INTERVAL = 1.0       # fold the journal back into SQLite this often
+MERGE_BATCH = 2000         # ... or once this many admissions are unmerged
+
+
+class JournalError(Exception):
+    pass
+
+
+def _transient(e):
+    # another connection holds the write lock: worth retrying
+    return isinstance(e, sqlite3.OperationalError) and (
+        "locked" in str(e) or "busy" in str(e)
+    )
+
+
+# ================= JOURNAL =================
+# Append-only, group-fsynced log of admissions made by TokenIndex.
+# One writer thread owns the file: it writes + fsyncs queued entries in
+# small groups, then periodically applies them to SQLite through
+# `apply_fn(entries)` and truncates the file. Whatever is still in the file
+# after a crash is replayed into SQLite on the next start.
+#
+# A failed write (disk full, fsync error) or a merge failing for any
+# reason other than a busy / locked database stops the journal: the
+# writer exits, append() and check() raise JournalError, and the store
+# refuses scans instead of admitting what can no longer be saved.
+# Unmerged entries stay in the file for the replay at the next start.
+class AdmissionJournal:
+    def __init__(self, path, apply_fn,
+                 group_size=GROUP_SIZE,
+                 fsync_interval=FSYNC_INTERVAL,
+                 merge_interval=MERGE_INTERVAL,
+                 merge_batch=MERGE_BATCH):
+        self.path = Path(path)
+        self._apply = apply_fn
+        self.group_size = group_size
+        self.fsync_interval = fsync_interval
+        self.merge_interval = merge_interval
+        self.merge_batch = merge_batch
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._unmerged = []
+        self._seq = 0
+        self._durable_seq = 0
+        self._closing = False
+        self._error = None
+        self._last_merge = time.monotonic()
+
+        self.groups = 0
+        self.merges = 0
+        self.merge_retries = 0
+
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"journal-{self.path.stem}",
+            daemon=True
+        )
+        self._thread.start()
+
+    # ---------- recovery ----------
+    @staticmethod
+    def replay(path, apply_fn):
+        path = Path(path)
+        if not path.exists():
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            # a torn last line (crash mid-write) has no newline: drop it
+            entries = [line[:-1] for line in f if line.endswith("\n")]
+        if entries:
+            apply_fn(entries)
+        path.unlink()
+        return len(entries)
+
+    # ---------- producers ----------
+    def _check(self):
+        if self._error is not None:
+            raise JournalError(f"Journal {self.path.name} stopped: {self._error}")
+
+    def check(self):
+        with self._cond:
+            self._check()
+
+    def append(self, entry):
+        with self._cond:
+            self._check()
+            self._pending.append(entry)
+            self._seq += 1
+            # the writer sleeps while idle: wake it for the first entry
+            # (starts the fsync timer) and for a full group
+            if len(self._pending) in (1, self.group_size):
+                self._cond.notify_all()
+            return self._seq
+
+    def wait_durable(self, seq, timeout=None):
+        with self._cond:
+            done = self._cond.wait_for(
+                lambda: self._durable_seq >= seq or self._error is not None,
+                timeout
+            )
+            if self._durable_seq < seq:
+                self._check()
+            return done
+
+    # ---------- writer thread ----------
+    def _merge_due(self):
+        if not self._unmerged:
+            return None
+        return max(0, self._last_merge + self.merge_interval - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closing:
+                    # idle: no wake-ups until an append or a due merge
+                    self._cond.wait_for(
+                        lambda: self._pending or self._closing,
+                        self._merge_due()
+                    )
+                if self._pending and not self._closing:
+                    self._cond.wait_for(
+                        lambda: self._closing
+                        or len(self._pending) >= self.group_size,
+                        self.fsync_interval
+                    )
+                batch, self._pending = self._pending, []
+                seq = self._seq
+                closing = self._closing
+
+            if batch and not self._write(batch, seq):
+                self._merge()           # journal unusable: straight to SQLite
+            elif self._unmerged and (
+                closing
+                or len(self._unmerged) >= self.merge_batch
+                or time.monotonic() - self._last_merge >= self.merge_interval
+            ):
+                self._merge()
+
+            if self._error is not None:
+                self._drain_after_error()
+                return
+
+            if closing:
+                with self._cond:
+                    if not self._pending:
+                        return
+
+    def _write(self, batch, seq):
+        # False when the file could not be written; the entries are kept
+        # in memory for the merge
+        self._unmerged.extend(batch)
+        try:
+            self._file.write("".join(f"{e}\n" for e in batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            self._fail(f"write failed: {e}")
+            return False
+        self.groups += 1
+        with self._cond:
+            self._durable_seq = seq
+            self._cond.notify_all()
+        return True
+
+    def _merge(self):
+        try:
+            self._apply(self._unmerged)
+        except Exception as e:
+            self._last_merge = time.monotonic()
+            if _transient(e):
+                # SQLite busy / locked: keep the journal, retry next round
+                self.merge_retries += 1
+            else:
+                self._fail(f"merge into SQLite failed: {e!r}")
+            return
+        self._unmerged = []
+        self._last_merge = time.monotonic()
+        self.merges += 1
+        try:
+            self._file.truncate(0)
+            self._file.seek(0)
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            self._fail(f"truncate failed: {e}")
+
+    def _fail(self, reason):
+        with self._cond:
+            if self._error is None:
+                self._error = reason
+                print(f"❌ Journal {self.path.name}: {reason} — scans are refused until restart")
+            self._cond.notify_all()
+
+    def _drain_after_error(self):
+        # append() refuses new entries now, but some may have been queued
+        # (and answered) since the last batch: still try to keep them
+        with self._cond:
+            leftover, self._pending = self._pending, []
+            seq = self._seq
+        if leftover and not self._write(leftover, seq):
+            self._merge()
+
+    # ---------- shutdown ----------
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._file.close()
+        if not self._unmerged and self.path.exists():
+            self.path.unlink()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "unmerged": len(self._unmerged),
+            "fsync_groups": self.groups,
+            "merges": self.merges,
+            "merge_retries": self.merge_retries,
+            "error": self._error
+        }
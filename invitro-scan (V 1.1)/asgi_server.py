@@ -0,0 +1,507 @@
+# Single process only: events are served from an in-memory TokenIndex
+# and journal (see event_store), so start it as `python server.py --async`
+# or `uvicorn asgi_server:app` WITHOUT --workers. A second process cannot
+# open an event another one holds (its .lock) and answers 500 instead.
+import asyncio
+import contextvars
+import inspect
+import json
+import re
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import metrics
+import scan_service
+from db_pool import reset_db_time, db_time
+from scan_service import RequestError, sse_message
+from live_feed import KEEPALIVE
+
+# ================= CONFIG =================
+DB_WORKERS = 8          # threads doing SQLite / index work
+MAX_PENDING = 256       # jobs queued on those threads before answering 503
+MAX_BODY = 1024 * 1024
+KEEP_ALIVE = 30         # seconds an idle gate connection is kept open
+
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=DB_WORKERS,
+    thread_name_prefix="scan-db"
+)
+_pending = 0
+
+# DB seconds of the request being handled (one list per request task)
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+# ================= EXECUTOR =================
+# All blocking work goes through here. _pending is only touched on the
+# event loop thread, so no lock is needed.
+def _timed_call(fn, args):
+    reset_db_time()
+    return fn(*args), db_time()
+
+
+async def offload(fn, *args):
+    global _pending
+    if _pending >= MAX_PENDING:
+        raise RequestError("Server busy", 503)
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result, spent = await loop.run_in_executor(
+            EXECUTOR, _timed_call, fn, args
+        )
+    finally:
+        _pending -= 1
+
+    acc = _request_db.get()
+    if acc is not None:
+        acc[0] += spent
+    return result
+
+
+def pending_jobs():
+    return _pending
+
+
+metrics.Callback(
+    "invitro_executor_pending", "Jobs queued or running on DB workers",
+    lambda: [((), _pending)]
+)
+
+
+# ================= FEED SIGNALS =================
+# Bridges LiveFeed.publish() (any thread) to asyncio waiters, so stream
+# and long-poll clients wait on the loop instead of holding a DB worker.
+class FeedSignal:
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def fire(self):
+        try:
+            self.loop.call_soon_threadsafe(self._fire)
+        except RuntimeError:
+            pass    # loop already closed (shutdown)
+
+    def _fire(self):
+        self.event.set()
+        self.event = asyncio.Event()
+
+
+_signals = weakref.WeakKeyDictionary()
+
+
+def feed_signal(feed):
+    sig = _signals.get(feed)
+    if sig is None:
+        sig = _signals[feed] = FeedSignal(asyncio.get_running_loop())
+        feed.add_listener(sig.fire)
+    return sig
+
+
+async def wait_change(feed, version, timeout, disconnected=None):
+    event = feed_signal(feed).event
+    if feed.version != version:
+        return True
+
+    waiter = asyncio.ensure_future(event.wait())
+    waits = [waiter] if disconnected is None else [waiter, disconnected]
+    await asyncio.wait(
+        waits,
+        timeout=timeout,
+        return_when=asyncio.FIRST_COMPLETED
+    )
+    waiter.cancel()
+    return feed.version != version
+
+
+# ================= RESPONSES =================
+# Non-JSON answers (metrics text, snapshot bytes)
+class Raw:
+    def __init__(self, body, content_type, status=200, headers=()):
+        self.body = body
+        self.content_type = content_type
+        self.status = status
+        self.headers = list(headers)
+
+
+class Stream:
+    def __init__(self, chunks, content_type, headers=()):
+        self.chunks = chunks
+        self.content_type = content_type
+        self.headers = list(headers)
+
+
+SSE_HEADERS = [
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no")
+]
+
+
+# ================= REQUEST =================
+class Request:
+    def __init__(self, scope, body, params):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.params = params
+        self.body = body
+        self.query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.headers = {
+            k.decode("latin-1").lower(): v.decode("latin-1")
+            for k, v in scope.get("headers", [])
+        }
+        self.disconnected = None
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def args(self):
+        return {k: v[0] for k, v in self.query.items()}
+
+    def number(self, value, kind=int):
+        if value is None:
+            return None
+        try:
+            return kind(value)
+        except ValueError:
+            raise RequestError(f"Bad number: {value}")
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"null")
+        except ValueError:
+            return None
+
+
+# ================= HANDLERS =================
+async def h_events(req):
+    return await offload(scan_service.list_events)
+
+async def h_scan(req):
+    return await offload(
+        scan_service.scan,
+        req.params["token"],
+        req.arg("gate"),
+        req.params.get("event")
+    )
+
+async def h_scan_batch(req):
+    return await offload(
+        scan_service.scan_batch,
+        req.json(),
+        req.params.get("event")
+    )
+
+async def h_stats(req):
+    return await offload(scan_service.stats, req.params.get("event"))
+
+async def h_stats_wait(req):
+    since = req.number(req.arg("since"))
+    timeout = min(req.number(req.arg("timeout", "25"), float), 60)
+    feed = await offload(store_feed, req.params.get("event"))
+    if since is not None:
+        await wait_change(feed, since, timeout)
+    return feed.snapshot(since)
+
+def store_feed(event):
+    return scan_service.get_store(event).feed
+
+async def h_stream(req):
+    feed = await offload(store_feed, req.params.get("event"))
+    since = req.number(req.headers.get("last-event-id"))
+    return sse_events(feed, since, req.disconnected)
+
+async def sse_events(feed, since, disconnected):
+    feed.subscribe()
+    try:
+        snap = feed.snapshot(since)
+        yield sse_message(snap).encode()
+        version = snap["version"]
+        while not disconnected.done():
+            if await wait_change(feed, version, KEEPALIVE, disconnected):
+                snap = feed.snapshot(version)
+                version = snap["version"]
+                yield sse_message(snap).encode()
+            elif not disconnected.done():
+                yield b": keepalive\n\n"
+    finally:
+        feed.unsubscribe()
+
+async def h_snapshot(req):
+    etag, data = await offload(
+        scan_service.snapshot,
+        req.headers.get("if-none-match"),
+        req.params.get("event")
+    )
+    headers = [(b"etag", etag.encode()), (b"cache-control", b"no-cache")]
+    if data is None:
+        return Raw(b"", "application/octet-stream", 304, headers)
+    return Raw(data, "application/octet-stream", headers=headers)
+
+async def h_token_key(req):
+    # reads the event registry (events.json) from disk
+    return await offload(scan_service.token_key, req.params.get("event"))
+
+async def h_admin_dashboard(req):
+    return await offload(scan_service.dashboard, req.params.get("event"))
+
+async def h_admin_activity(req):
+    return await offload(
+        scan_service.activity, req.args(), req.params.get("event")
+    )
+
+async def h_admin_gates(req):
+    return await offload(
+        scan_service.gates, req.args(), req.params.get("event")
+    )
+
+async def h_admin_arrivals(req):
+    return await offload(
+        scan_service.arrivals, req.args(), req.params.get("event")
+    )
+
+async def h_admin_export(req):
+    content_type, filename, chunks = await offload(
+        scan_service.export, req.args(), req.params.get("event")
+    )
+    disposition = f'attachment; filename="{filename}"'.encode()
+    return Stream(
+        export_chunks(chunks),
+        content_type,
+        [(b"content-disposition", disposition)]
+    )
+
+async def export_chunks(chunks):
+    # each page is a DB read: run it on a worker, not the loop
+    while True:
+        chunk = await offload(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk.encode()
+
+async def h_admin_pool(req):
+    return scan_service.pool_stats()
+
+async def h_admin_store(req):
+    return await offload(scan_service.store_stats, req.params.get("event"))
+
+async def h_admin_stores(req):
+    return scan_service.cache_stats()
+
+async def h_metrics_endpoint(req):
+    return Raw(scan_service.metrics_text().encode(), metrics.CONTENT_TYPE)
+
+
+# optional /events/<event> prefix, same as the Flask routes
+EV = r"(?:/events/(?P<event>[^/]+))?"
+
+# (method, path regex, handler, streams)
+ROUTES = [
+    ("GET", r"/events", h_events, False),
+    ("POST", EV + r"/scan/batch", h_scan_batch, False),
+    ("POST", EV + r"/scan/(?P<token>[^/]+)", h_scan, False),
+    ("GET", EV + r"/stats", h_stats, False),
+    ("GET", EV + r"/stats/wait", h_stats_wait, False),
+    ("GET", EV + r"/stream", h_stream, True),
+    ("GET", EV + r"/snapshot", h_snapshot, False),
+    ("GET", EV + r"/token-key", h_token_key, False),
+    ("GET", r"/admin/dashboard", h_admin_dashboard, False),
+    ("GET", r"/events/(?P<event>[^/]+)/dashboard", h_admin_dashboard, False),
+    ("GET", r"/admin/activity", h_admin_activity, False),
+    ("GET", r"/events/(?P<event>[^/]+)/activity", h_admin_activity, False),
+    ("GET", r"/admin/gates", h_admin_gates, False),
+    ("GET", r"/events/(?P<event>[^/]+)/gates", h_admin_gates, False),
+    ("GET", r"/admin/arrivals", h_admin_arrivals, False),
+    ("GET", r"/events/(?P<event>[^/]+)/arrivals", h_admin_arrivals, False),
+    ("GET", r"/admin/export", h_admin_export, True),
+    ("GET", r"/events/(?P<event>[^/]+)/export", h_admin_export, True),
+    ("GET", r"/admin/pool", h_admin_pool, False),
+    ("GET", r"/admin/store", h_admin_store, False),
+    ("GET", r"/events/(?P<event>[^/]+)/store", h_admin_store, False),
+    ("GET", r"/admin/stores", h_admin_stores, False),
+    ("GET", r"/metrics", h_metrics_endpoint, False),
+]
+ROUTES = [(m, re.compile(p + r"\Z"), h, s) for m, p, h, s in ROUTES]
+
+
+def match(method, path):
+    for m, pattern, handler, streams in ROUTES:
+        found = pattern.match(path)
+        if found and m == method:
+            return handler, streams, found.groupdict()
+    return None
+
+
+# ================= ASGI PLUMBING =================
+async def read_body(receive):
+    body = b""
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            return None
+        body += msg.get("body", b"")
+        if len(body) > MAX_BODY:
+            raise RequestError("Request too large", 413)
+        if not msg.get("more_body"):
+            return body
+
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode())
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_raw(send, raw):
+    await send({
+        "type": "http.response.start",
+        "status": raw.status,
+        "headers": [
+            (b"content-type", raw.content_type.encode()),
+            (b"content-length", str(len(raw.body)).encode())
+        ] + raw.headers
+    })
+    await send({"type": "http.response.body", "body": raw.body})
+
+
+async def send_stream(send, chunks, disconnected, content_type, headers):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", content_type.encode())] + headers
+    })
+    try:
+        async for chunk in chunks:
+            if disconnected.done():
+                break
+            await send({
+                "type": "http.response.body",
+                "body": chunk,
+                "more_body": True
+            })
+    finally:
+        await chunks.aclose()
+    if not disconnected.done():
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def lifespan(receive, send):
+    loop = asyncio.get_running_loop()
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            await loop.run_in_executor(EXECUTOR, scan_service.init)
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            await loop.run_in_executor(EXECUTOR, scan_service.close_stores)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    started = time.perf_counter()
+    db_acc = [0.0]
+    _request_db.set(db_acc)
+    status = [500]
+
+    async def tracked_send(msg):
+        if msg["type"] == "http.response.start":
+            status[0] = msg["status"]
+        await send(msg)
+
+    found = match(scope["method"], scope["path"])
+    route = found[0].__name__[2:] if found else "unmatched"
+    try:
+        if found is None:
+            await send_json(tracked_send, {"success": False, "msg": "Not found"}, 404)
+            return
+        await dispatch(scope, receive, tracked_send, *found)
+    finally:
+        metrics.observe_request(
+            route, status[0], time.perf_counter() - started, db_acc[0]
+        )
+
+
+async def dispatch(scope, receive, send, handler, streams, params):
+    disconnected = None
+    try:
+        try:
+            body = await read_body(receive)
+            if body is None:
+                return
+            req = Request(scope, body, params)
+            if streams:
+                disconnected = req.disconnected = asyncio.ensure_future(
+                    wait_disconnect(receive)
+                )
+            result = await handler(req)
+        except RequestError as e:
+            await send_json(send, {"success": False, "msg": e.msg}, e.status)
+            return
+        except RuntimeError as e:
+            # e.g. "No active event selected"
+            await send_json(send, {"success": False, "msg": str(e)}, 500)
+            return
+
+        if isinstance(result, Stream):
+            await send_stream(
+                send, result.chunks, disconnected,
+                result.content_type, result.headers
+            )
+        elif inspect.isasyncgen(result):
+            await send_stream(
+                send, result, disconnected, "text/event-stream", SSE_HEADERS
+            )
+        elif isinstance(result, Raw):
+            await send_raw(send, result)
+        else:
+            await send_json(send, result)
+    finally:
+        if disconnected is not None:
+            disconnected.cancel()
+
+
+# ================= RUN =================
+# One process (uvicorn's default): scale with DB_WORKERS, not --workers.
+def run(host="127.0.0.1", port=5000):
+    try:
+        import uvicorn
+    except ImportError:
+        return False
+
+    uvicorn.run(
+        app,
+        host=host,
+        port=port,
+        timeout_keep_alive=KEEP_ALIVE,
+        log_level="warning"
+    )
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    if not run():
+        print("❌ uvicorn not installed (pip install uvicorn)")
+        sys.exit(1)
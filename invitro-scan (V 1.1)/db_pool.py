@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# ================= CONFIG =================
+# WAL lets the dashboards keep reading while a gate is writing.
+JOURNAL_MODE = "WAL"
+# NORMAL is crash-safe in WAL mode (fsync happens at checkpoint time).
+# Use FULL if every admission must survive a power cut.
+SYNCHRONOUS = "NORMAL"
+CACHE_SIZE_KB = 16 * 1024
+MMAP_SIZE = 64 * 1024 * 1024
+BUSY_TIMEOUT_MS = 5000
+MAX_IDLE_PER_DB = 8
+
+
+# ================= DB TIME =================
+# Per-thread total of time spent holding pooled connections, so request
+# metrics can split DB time from total time.
+_db_time = threading.local()
+
+
+def reset_db_time():
+    _db_time.total = 0.0
+
+
+def db_time():
+    return getattr(_db_time, "total", 0.0)
+
+
+# ================= POOL =================
+class ConnectionPool:
+    def __init__(self,
+                 synchronous=SYNCHRONOUS,
+                 cache_size_kb=CACHE_SIZE_KB,
+                 mmap_size=MMAP_SIZE,
+                 busy_timeout_ms=BUSY_TIMEOUT_MS,
+                 max_idle=MAX_IDLE_PER_DB):
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_idle = max_idle
+
+        self._lock = threading.Lock()
+        self._idle = {}      # db path -> [connection, ...]
+        self._in_use = {}    # db path -> count
+
+        self.opened = 0
+        self.reused = 0
+        self.closed = 0
+
+    # ---------- open / configure ----------
+    def _open(self, path):
+        con = sqlite3.connect(
+            path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False
+        )
+        con.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        con.execute(f"PRAGMA synchronous={self.synchronous}")
+        con.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        con.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        con.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        con.execute("PRAGMA temp_store=MEMORY")
+        return con
+
+    # ---------- checkout / checkin ----------
+    def _checkout(self, path):
+        with self._lock:
+            idle = self._idle.get(path)
+            self._in_use[path] = self._in_use.get(path, 0) + 1
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.opened += 1
+
+        try:
+            return self._open(path)
+        except Exception:
+            with self._lock:
+                self._in_use[path] -= 1
+                self.opened -= 1
+            raise
+
+    def _checkin(self, path, con):
+        # never hand out a connection with a half-finished transaction
+        if con.in_transaction:
+            con.rollback()
+
+        with self._lock:
+            self._in_use[path] -= 1
+            idle = self._idle.setdefault(path, [])
+            if len(idle) < self.max_idle:
+                idle.append(con)
+                return
+            self.closed += 1
+        con.close()
+
+    @contextmanager
+    def connection(self, db_path):
+        path = str(db_path)
+        started = time.perf_counter()
+        con = self._checkout(path)
+        try:
+            yield con
+        except Exception:
+            if con.in_transaction:
+                con.rollback()
+            raise
+        finally:
+            self._checkin(path, con)
+            _db_time.total = db_time() + time.perf_counter() - started
+
+    # ---------- maintenance ----------
+    def close_db(self, db_path):
+        path = str(db_path)
+        with self._lock:
+            idle = self._idle.pop(path, [])
+            self.closed += len(idle)
+        for con in idle:
+            con.close()
+
+    def close_all(self):
+        with self._lock:
+            paths = list(self._idle)
+        for path in paths:
+            self.close_db(path)
+
+    def stats(self):
+        with self._lock:
+            dbs = {
+                path: {
+                    "idle": len(self._idle.get(path, [])),
+                    "in_use": self._in_use.get(path, 0)
+                }
+                for path in set(self._idle) | set(self._in_use)
+            }
+            return {
+                "journal_mode": JOURNAL_MODE,
+                "synchronous": self.synchronous,
+                "cache_size_kb": self.cache_size_kb,
+                "max_idle_per_db": self.max_idle,
+                "opened": self.opened,
+                "reused": self.reused,
+                "closed": self.closed,
+                "databases": dbs
+            }
@@ -1,54 +1,7 @@
-import json
-import os
-import sys
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-from pathlib import Path
-
-# ================= BASE DIR (exe safe) =================
-def app_base_dir():
-    if getattr(sys, 'frozen', False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent
-
-BASE_DIR = app_base_dir()
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(exist_ok=True)
-
-EVENTS_FILE = DATA_DIR / "events.json"
-
-# ================= FILE HELPERS =================
-def load_events():
-    if not EVENTS_FILE.exists():
-        data = {
-            "active": None,
-            "events": {}
-        }
-        save_events(data)
-        return data
-
-    with open(EVENTS_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # 🔒 SAFETY: ensure every event has db + csv
-    changed = False
-    for name, cfg in data.get("events", {}).items():
-        if "db" not in cfg:
-            cfg["db"] = f"{name}.db"
-            changed = True
-        if "csv" not in cfg:
-            cfg["csv"] = f"{name}_invites.csv"
-            changed = True
-
-    if changed:
-        save_events(data)
-
-    return data
-
 
-def save_events(data):
-    with open(EVENTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+from event_registry import load_events, save_events
 
 # ================= GUI =================
 class EventManagerGUI:
@@ -0,0 +1,130 @@
+import copy
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# ================= BASE DIR (exe safe) =================
+def app_base_dir():
+    if getattr(sys, 'frozen', False):
+        return Path(sys.executable).parent
+    return Path(__file__).parent
+
+BASE_DIR = app_base_dir()
+DATA_DIR = BASE_DIR / "data"
+DATA_DIR.mkdir(exist_ok=True)
+
+EVENTS_FILE = DATA_DIR / "events.json"
+
+# ================= CONFIG =================
+# How often (seconds) to stat() events.json for changes made by another
+# process. Between checks the registry is served from memory.
+CHECK_INTERVAL = 1.0
+
+# ================= CACHE =================
+_lock = threading.Lock()
+_cache = {
+    "data": None,
+    "stamp": None,      # (mtime_ns, size) of the file the data came from
+    "checked": 0.0
+}
+
+
+def _file_stamp():
+    try:
+        st = os.stat(EVENTS_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _with_defaults(data):
+    # 🔒 SAFETY: ensure every event has db + csv
+    changed = False
+    for name, cfg in data.get("events", {}).items():
+        if "db" not in cfg:
+            cfg["db"] = f"{name}.db"
+            changed = True
+        if "csv" not in cfg:
+            cfg["csv"] = f"{name}_invites.csv"
+            changed = True
+    return changed
+
+
+def _write(data):
+    # write-and-rename: readers never see a half-written file
+    tmp = EVENTS_FILE.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, EVENTS_FILE)
+
+
+def _registry():
+    now = time.monotonic()
+    if _cache["data"] is not None and now - _cache["checked"] < CHECK_INTERVAL:
+        return _cache["data"]
+
+    with _lock:
+        stamp = _file_stamp()
+        _cache["checked"] = now
+        if _cache["data"] is not None and stamp == _cache["stamp"]:
+            return _cache["data"]
+
+        if stamp is None:
+            data = {
+                "active": None,
+                "events": {}
+            }
+            _write(data)
+        else:
+            with open(EVENTS_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if _with_defaults(data):
+                _write(data)
+
+        _cache["data"] = data
+        _cache["stamp"] = _file_stamp()
+        return data
+
+
+# ================= PUBLIC API =================
+def load_events():
+    # callers are free to edit the returned dict and pass it to save_events
+    return copy.deepcopy(_registry())
+
+
+def save_events(data):
+    data = copy.deepcopy(data)
+    _with_defaults(data)
+    with _lock:
+        _write(data)
+        _cache["data"] = data
+        _cache["stamp"] = _file_stamp()
+        _cache["checked"] = time.monotonic()
+
+
+def get_active_event():
+    data = _registry()
+    active = data.get("active")
+    if not active or active not in data["events"]:
+        raise RuntimeError("No active event selected")
+    return active
+
+
+def get_event(name):
+    cfg = _registry()["events"].get(name)
+    if cfg is None:
+        raise KeyError(name)
+    return cfg
+
+
+def event_db_path(name):
+    return DATA_DIR / get_event(name)["db"]
+
+
+def event_csv_path(name):
+    return BASE_DIR / get_event(name)["csv"]
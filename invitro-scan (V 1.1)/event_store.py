@@ -0,0 +1,429 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import invite_db
+import metrics
+import token_snapshot
+from admission_journal import AdmissionJournal
+from live_feed import LiveFeed
+from token_index import TokenIndex, NegativeCache
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# ================= CONFIG =================
+USE_MEMORY_INDEX = True
+INDEX_MAX_TOKENS = 2_000_000
+# True = new event DBs store tokens as integers (invite_db.INT_LAYOUT);
+# existing DBs keep their layout until migrate_tokens.py converts them.
+INT_TOKENS = False
+# True = a scan only answers once its journal group is fsynced
+# (adds ~FSYNC_INTERVAL of latency, closes the crash window).
+WAIT_DURABLE = False
+
+# StoreCache limits: how many events stay open at once, and roughly how
+# much memory their indexes may use together.
+MAX_OPEN_EVENTS = 8
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+INDEX_BYTES_PER_TOKEN = 120      # dict slot + str object + used flag
+NEGATIVE_BYTES_PER_ENTRY = 100
+
+# Offline snapshots for scanners are rebuilt at most this often (seconds);
+# scanners learn about admissions in between from /stream.
+SNAPSHOT_MIN_INTERVAL = 2.0
+
+
+class StoreClosed(Exception):
+    pass
+
+
+class StoreLocked(Exception):
+    pass
+
+
+# ================= PROCESS LOCK =================
+# TokenIndex and the journal live in one process's memory: a second
+# process opening the same event (uvicorn --workers N, Flask and ASGI
+# side by side) would keep its own index and admit every token again,
+# and two writers would share one .journal file. Each open event holds
+# an exclusive OS lock on <event>.lock; the OS drops it if we die.
+def lock_event(path):
+    f = open(path, "a+")
+    try:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise StoreLocked(
+            f"Event {path.stem} is open in another server process — "
+            f"run a single process (no --workers)"
+        )
+    return f
+
+
+# ================= JOURNAL ENTRIES =================
+# One JSON array per journal line: [ts, gate, token, result, client_ts]
+def encode_entry(ts, gate, token, result, client_ts=None):
+    return json.dumps([ts, gate, token, result, client_ts])
+
+
+def decode_entry(line):
+    if line.startswith("["):
+        return tuple(json.loads(line))
+    # journals written before the admissions log held bare tokens
+    return (time.time(), None, line, invite_db.ADMITTED, None)
+
+
+# ================= EVENT STORE =================
+# Everything the server needs to answer scans for one event: the SQLite
+# file (through the shared pool) plus, when it fits, an in-memory
+# TokenIndex with a write-behind AdmissionJournal.
+class EventStore:
+    def __init__(self, name, db_path, csv_path, pool,
+                 use_index=USE_MEMORY_INDEX,
+                 max_index_tokens=INDEX_MAX_TOKENS,
+                 wait_durable=WAIT_DURABLE):
+        self.name = name
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.pool = pool
+        self.wait_durable = wait_durable
+
+        self.index = None
+        self.journal = None
+        self.negative = NegativeCache()
+
+        # snapshot versions restart with the store, epoch tells them apart
+        self.epoch = time.time_ns()
+        self._snapshot = None       # (version, built_at, bytes)
+        self._snapshot_lock = threading.Lock()
+
+        # close() waits for in-flight calls, later calls raise StoreClosed
+        self._state = threading.Condition()
+        self._busy = 0
+        self.closed = False
+
+        journal_path = db_path.with_suffix(".journal")
+
+        # before the replay: another process may own the journal
+        self._lock_file = lock_event(db_path.with_suffix(".lock"))
+        try:
+            with pool.connection(db_path) as con:
+                self.layout = invite_db.ensure_schema(con, compact=INT_TOKENS)
+                invite_db.import_csv(con, csv_path, self.layout)
+                AdmissionJournal.replay(journal_path, self._merge)
+
+                total = invite_db.read_counters(con)["total"]
+                if use_index and total <= max_index_tokens:
+                    self.index = TokenIndex.load(con, self.layout)
+
+            # every scan outcome is journalled; in memory mode the journal
+            # is also what carries used flags back to SQLite
+            self.journal = AdmissionJournal(journal_path, self._merge)
+        except BaseException:
+            self._lock_file.close()
+            raise
+
+        self.feed = LiveFeed(self.counters())
+
+    def _merge(self, lines):
+        entries = [decode_entry(line) for line in lines]
+        with self.pool.connection(self.db_path) as con:
+            invite_db.record_admissions(con, entries, self.layout)
+
+    @contextmanager
+    def _using(self):
+        with self._state:
+            if self.closed:
+                raise StoreClosed(self.name)
+            self._busy += 1
+        try:
+            yield
+        finally:
+            with self._state:
+                self._busy -= 1
+                if not self._busy:
+                    self._state.notify_all()
+
+    # ---------- scans ----------
+    def _record(self, tokens, results, gate, client_ts):
+        now = time.time()
+        seq = None
+        for token, result, cts in zip(tokens, results, client_ts):
+            metrics.SCANS.inc(result)
+            last = self.journal.append(
+                encode_entry(now, gate, token, result, cts)
+            )
+            if result == invite_db.ADMITTED:
+                seq = last
+        if seq is not None and self.index is not None and self.wait_durable:
+            self.journal.wait_durable(seq)
+
+        admitted = [
+            t for t, r in zip(tokens, results) if r == invite_db.ADMITTED
+        ]
+        return now, admitted
+
+    def _publish(self, counters, tokens, gate, now):
+        self.feed.publish(counters, [
+            {"token": t, "gate": gate, "ts": now} for t in tokens
+        ])
+
+    def admit(self, token, gate=None, client_ts=None):
+        with self._using():
+            # a stopped journal cannot save the admission: refuse the
+            # scan before marking anything used
+            self.journal.check()
+            result, counters = self._admit(token)
+            now, admitted = self._record([token], [result], gate, [client_ts])
+        if admitted:
+            self._publish(counters, admitted, gate, now)
+        return result, counters
+
+    def _admit(self, token):
+        if self.index is not None:
+            return self.index.admit(token)
+
+        cached = self.negative.get(token)
+        if cached is not None:
+            return cached, None
+
+        with self.pool.connection(self.db_path) as con:
+            result, counters = invite_db.admit(con, token, self.layout)
+
+        if result != invite_db.ADMITTED:
+            self.negative.put(token, result)
+        return result, counters
+
+    def admit_many(self, tokens, gate=None, client_ts=None):
+        client_ts = client_ts or [None] * len(tokens)
+        with self._using():
+            self.journal.check()
+            results, counters = self._admit_many(tokens)
+            now, admitted = self._record(tokens, results, gate, client_ts)
+        if admitted:
+            self._publish(counters, admitted, gate, now)
+        return results, counters
+
+    def _admit_many(self, tokens):
+        if self.index is not None:
+            return self.index.admit_many(tokens)
+
+        results = [self.negative.get(t) for t in tokens]
+        todo = [t for t, r in zip(tokens, results) if r is None]
+        with self.pool.connection(self.db_path) as con:
+            fresh, counters = invite_db.admit_many(con, todo, self.layout)
+
+        fresh = iter(fresh)
+        for i, token in enumerate(tokens):
+            if results[i] is None:
+                results[i] = next(fresh)
+                if results[i] != invite_db.ADMITTED:
+                    self.negative.put(token, results[i])
+        return results, counters
+
+    def counters(self):
+        if self.index is not None:
+            return self.index.counters()
+        with self._using():
+            with self.pool.connection(self.db_path) as con:
+                return invite_db.read_counters(con)
+
+    def activity(self, **filters):
+        with self._using():
+            with self.pool.connection(self.db_path) as con:
+                return invite_db.query_admissions(con, **filters)
+
+    def gate_summary(self, since=None, until=None):
+        with self._using():
+            with self.pool.connection(self.db_path) as con:
+                return invite_db.gate_summary(con, since, until)
+
+    def arrivals(self, minutes, result=invite_db.ADMITTED):
+        with self._using():
+            with self.pool.connection(self.db_path) as con:
+                return invite_db.arrivals(con, minutes, result)
+
+    # ---------- export (one keyset page per call) ----------
+    def export_invites(self, after=None, used=None, since=None, until=None):
+        with self._using():
+            with self.pool.connection(self.db_path) as con:
+                return invite_db.export_invites(
+                    con, self.layout, after, used, since, until
+                )
+
+    def export_admissions(self, after=None, **filters):
+        with self._using():
+            with self.pool.connection(self.db_path) as con:
+                return invite_db.export_admissions(con, after, **filters)
+
+    # ---------- offline snapshot ----------
+    def snapshot(self):
+        # -> (etag, bytes) of a token_snapshot for scanners to map locally
+        with self._using(), self._snapshot_lock:
+            version = self.feed.version
+            cached = self._snapshot
+            if cached is None or (
+                    cached[0] != version
+                    and time.monotonic() - cached[1] >= SNAPSHOT_MIN_INTERVAL):
+                if self.index is not None:
+                    data = token_snapshot.build(
+                        self.index.items(), self.epoch, version
+                    )
+                else:
+                    with self.pool.connection(self.db_path) as con:
+                        data = token_snapshot.build(
+                            invite_db.invite_rows(con, self.layout),
+                            self.epoch,
+                            version
+                        )
+                cached = self._snapshot = (version, time.monotonic(), data)
+
+        return f'"{self.epoch}-{cached[0]}"', cached[2]
+
+    # ---------- lifecycle ----------
+    def memory_bytes(self):
+        index = len(self.index) if self.index is not None else 0
+        snapshot = len(self._snapshot[2]) if self._snapshot else 0
+        return (index * INDEX_BYTES_PER_TOKEN
+                + len(self.negative) * NEGATIVE_BYTES_PER_ENTRY
+                + snapshot)
+
+    def pinned(self):
+        # evicting a store with live subscribers would silence their stream
+        return self.feed.subscribers > 0
+
+    def close(self):
+        with self._state:
+            self.closed = True
+            self._state.wait_for(lambda: not self._busy)
+        self.journal.close()
+        self.pool.close_db(self.db_path)
+        self._lock_file.close()
+
+    def stats(self):
+        return {
+            "event": self.name,
+            "mode": "memory" if self.index is not None else "sqlite",
+            "storage": self.layout.name,
+            "tokens": self.counters()["total"],
+            "journal": self.journal.stats(),
+            "negative_cache": {
+                "size": len(self.negative),
+                "hits": self.negative.hits
+            },
+            "subscribers": self.feed.subscribers,
+            "memory_bytes": self.memory_bytes()
+        }
+
+
+# ================= STORE CACHE =================
+# LRU of open EventStores. Loading an event happens outside the cache
+# lock, so a cold event being loaded never stalls scans for hot ones.
+class StoreCache:
+    def __init__(self, open_store, keep=None,
+                 max_open=MAX_OPEN_EVENTS,
+                 max_bytes=MAX_CACHE_BYTES):
+        self._open_store = open_store
+        self._keep = keep or (lambda name: False)
+        self.max_open = max_open
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._stores = OrderedDict()
+        self._loading = {}      # name -> Event, set once the open finishes
+        self._closing = {}      # name -> Event, set once the close finishes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name):
+        while True:
+            with self._lock:
+                store = self._stores.get(name)
+                if store is not None:
+                    self._stores.move_to_end(name)
+                    self.hits += 1
+                    return store
+                busy = self._loading.get(name) or self._closing.get(name)
+                if busy is None:
+                    loading = self._loading[name] = threading.Event()
+                    self.misses += 1
+                    break
+            # another thread is opening / closing this event (its journal
+            # file must not have two owners): wait, then look again
+            busy.wait()
+
+        store = None
+        victims = []
+        try:
+            store = self._open_store(name)
+        finally:
+            with self._lock:
+                del self._loading[name]
+                if store is not None:
+                    self._stores[name] = store
+                    victims = self._evict(name)
+            loading.set()
+
+        self._close(victims)
+        return store
+
+    def _close(self, stores):
+        for store in stores:
+            try:
+                store.close()
+            finally:
+                with self._lock:
+                    self._closing.pop(store.name).set()
+
+    def _evict(self, newest):
+        total = sum(s.memory_bytes() for s in self._stores.values())
+        victims = []
+        for name, store in list(self._stores.items()):
+            if len(self._stores) <= self.max_open and total <= self.max_bytes:
+                break
+            if name == newest or self._keep(name) or store.pinned():
+                continue
+            del self._stores[name]
+            self._closing[name] = threading.Event()
+            total -= store.memory_bytes()
+            victims.append(store)
+            self.evictions += 1
+        return victims
+
+    def open_stores(self):
+        with self._lock:
+            return list(self._stores.values())
+
+    def close_all(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            self._stores.clear()
+            for store in stores:
+                self._closing[store.name] = threading.Event()
+        self._close(stores)
+
+    def stats(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        return {
+            "open": [s.name for s in stores],
+            "memory_bytes": sum(s.memory_bytes() for s in stores),
+            "max_open": self.max_open,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions
+        }
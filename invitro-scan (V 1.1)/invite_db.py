@@ -0,0 +1,548 @@
+import csv
+import hashlib
+import re
+import time
+
+# ================= RESULTS =================
+ADMITTED = "OK"
+ALREADY = "ALREADY"
+INVALID = "INVALID"
+
+MESSAGES = {
+    ADMITTED: "Entry allowed",
+    ALREADY: "Already entered",
+    INVALID: "Invalid token"
+}
+
+# ================= SCHEMA =================
+# counters holds a single row kept in sync by triggers, so total / used
+# never need a COUNT(*) over invites and always change in the same
+# transaction as the invite row itself.
+SCHEMA = """
+-- append-only log of every scan outcome (OK / ALREADY / INVALID);
+-- ts is server time, client_ts what the gate reported (batch scans)
+CREATE TABLE IF NOT EXISTS admissions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    gate TEXT,
+    token TEXT NOT NULL,
+    result TEXT NOT NULL,
+    client_ts REAL
+);
+
+CREATE INDEX IF NOT EXISTS admissions_ts ON admissions(ts);
+CREATE INDEX IF NOT EXISTS admissions_gate_ts ON admissions(gate, ts);
+CREATE INDEX IF NOT EXISTS admissions_result_ts ON admissions(result, ts);
+
+-- per-minute rollup of admissions, kept by a trigger so dashboards read
+-- a few rows per minute instead of aggregating the log on every poll;
+-- minute = unix seconds at the start of the bucket
+CREATE TABLE IF NOT EXISTS arrivals (
+    minute INTEGER NOT NULL,
+    gate TEXT NOT NULL,
+    result TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (minute, gate, result)
+) WITHOUT ROWID;
+
+-- one-time backfill for databases logged before the rollup existed
+INSERT INTO arrivals(minute, gate, result, count)
+    SELECT CAST(ts / 60 AS INTEGER) * 60, COALESCE(gate, ''), result, COUNT(*)
+    FROM admissions
+    WHERE NOT EXISTS (SELECT 1 FROM arrivals)
+    GROUP BY 1, 2, 3;
+
+CREATE TRIGGER IF NOT EXISTS admissions_rollup
+AFTER INSERT ON admissions
+BEGIN
+    INSERT INTO arrivals(minute, gate, result, count)
+    VALUES (CAST(NEW.ts / 60 AS INTEGER) * 60, COALESCE(NEW.gate, ''), NEW.result, 1)
+    ON CONFLICT(minute, gate, result) DO UPDATE SET count = count + 1;
+END;
+
+-- what has already been imported from each invite CSV:
+-- offset = end of the last complete line read, prefix_hash = sha1 of
+-- bytes [0, offset) so appends can be told apart from rewrites
+CREATE TABLE IF NOT EXISTS csv_imports (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    prefix_hash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total INTEGER NOT NULL,
+    used INTEGER NOT NULL
+);
+"""
+
+# {used} / {new} / {old}: the layout's "row is used" test on a plain
+# row / NEW / OLD
+COUNTER_TRIGGERS = """
+-- one-time backfill for databases created before counters existed
+INSERT OR IGNORE INTO counters(id, total, used)
+    SELECT 1, COUNT(*), COALESCE(SUM({used}), 0) FROM invites;
+
+CREATE TRIGGER IF NOT EXISTS invites_count_insert
+AFTER INSERT ON invites
+BEGIN
+    UPDATE counters
+    SET total = total + 1, used = used + ({new})
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS invites_count_delete
+AFTER DELETE ON invites
+BEGIN
+    UPDATE counters
+    SET total = total - 1, used = used - ({old})
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS invites_count_used
+AFTER UPDATE OF used ON invites
+WHEN ({new}) <> ({old})
+BEGIN
+    UPDATE counters
+    SET used = used + ({new}) - ({old})
+    WHERE id = 1;
+END;
+"""
+
+
+# ================= TOKEN LAYOUTS =================
+# How invites are stored. Every function below takes the layout of the
+# DB it works on and converts tokens to keys on the way in, keys back to
+# tokens on the way out; callers only ever see token strings.
+class TokenLayout:
+    def __init__(self, name, table, key_column, used_expr, use_sql):
+        self.name = name
+        self.table = table
+        self.key_column = key_column
+        self.used_sql = used_expr.format(t="")
+        self.use_sql = use_sql
+        self.insert_sql = f"INSERT OR IGNORE INTO invites({key_column}) VALUES (?)"
+        self.exists_sql = f"SELECT 1 FROM invites WHERE {key_column} = ?"
+        self.rows_sql = f"SELECT {key_column}, {self.used_sql} FROM invites"
+        self.triggers = COUNTER_TRIGGERS.format(
+            used=self.used_sql,
+            new=used_expr.format(t="NEW."),
+            old=used_expr.format(t="OLD.")
+        )
+
+    def to_key(self, token):
+        # None: cannot be an invite in this layout
+        return token
+
+    def to_token(self, key):
+        return key
+
+    def admitted_at(self, used):
+        # unix seconds, None if the layout does not record it
+        return None
+
+
+# Original layout: token text as primary key of a rowid table, so every
+# lookup is an index probe plus a table fetch. used is 0 / 1.
+TEXT_LAYOUT = TokenLayout(
+    "text",
+    """
+CREATE TABLE IF NOT EXISTS invites (
+    token TEXT PRIMARY KEY,
+    used INTEGER DEFAULT 0
+);
+""",
+    "token",
+    "({t}used = 1)",
+    "UPDATE invites SET used = 1 WHERE token = :key AND used = 0"
+)
+
+
+# Compact layout for qr_slips tokens (12 hex digits = 48 bits): the token
+# as an integer key of a clustered WITHOUT ROWID table, so a lookup is a
+# single b-tree probe and a row is ~10 bytes instead of ~40.
+# used packs flag and time: 0 = unused, else admission time in unix ms.
+class IntLayout(TokenLayout):
+    TOKEN_RE = re.compile(r"[0-9A-F]{12}\Z")
+
+    def to_key(self, token):
+        if not self.TOKEN_RE.match(token):
+            return None
+        return int(token, 16)
+
+    def to_token(self, key):
+        return f"{key:012X}"
+
+    def admitted_at(self, used):
+        return used / 1000 if used else None
+
+
+INT_LAYOUT = IntLayout(
+    "int",
+    """
+CREATE TABLE IF NOT EXISTS invites (
+    key INTEGER PRIMARY KEY,
+    used INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+""",
+    "key",
+    "({t}used <> 0)",
+    "UPDATE invites SET used = :ts WHERE key = :key AND used = 0"
+)
+
+
+def storage_layout(con):
+    # layout of an existing DB, None if it has no invites table yet
+    row = con.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'invites'"
+    ).fetchone()
+    if row is None:
+        return None
+    return INT_LAYOUT if "WITHOUT ROWID" in row[0].upper() else TEXT_LAYOUT
+
+
+def ensure_schema(con, compact=False):
+    # compact only picks the layout of a new DB; existing ones keep theirs
+    # (migrate_tokens.py converts)
+    layout = storage_layout(con)
+    if layout is None:
+        layout = INT_LAYOUT if compact else TEXT_LAYOUT
+    con.executescript(layout.table + SCHEMA + layout.triggers)
+    con.commit()
+    return layout
+
+
+def _use_args(layout, token, ts):
+    key = layout.to_key(token)
+    if key is None:
+        return None
+    return {"key": key, "ts": int(ts * 1000)}
+
+
+# ================= CSV IMPORT =================
+IMPORT_CHUNK = 5000
+HASH_BLOCK = 1024 * 1024
+
+
+def _hash_prefix(f, h, length):
+    f.seek(0)
+    left = length
+    while left > 0:
+        block = f.read(min(HASH_BLOCK, left))
+        if not block:
+            break
+        h.update(block)
+        left -= len(block)
+    return left == 0
+
+
+def _insert_lines(cur, lines, layout):
+    # -> number of rows whose token does not fit the layout
+    keys = [
+        layout.to_key(row[0].strip())
+        for row in csv.reader(lines)
+        if row and row[0].strip()
+    ]
+    cur.executemany(layout.insert_sql, [(k,) for k in keys if k is not None])
+    return keys.count(None)
+
+
+def import_csv(con, csv_path, layout=TEXT_LAYOUT):
+    # SAFE: can be run multiple times (INSERT OR IGNORE).
+    # Unchanged files are skipped on stat() alone, appended rows are read
+    # from the recorded offset, anything else is re-imported in full.
+    if not csv_path.exists():
+        return 0
+
+    st = csv_path.stat()
+    key = str(csv_path.resolve())
+    state = con.execute(
+        "SELECT size, mtime_ns, offset, prefix_hash "
+        "FROM csv_imports WHERE path = ?",
+        (key,)
+    ).fetchone()
+
+    if state and state[0] == st.st_size and state[1] == st.st_mtime_ns:
+        return 0
+
+    cur = con.cursor()
+    imported = 0
+    skipped = 0
+
+    with open(csv_path, "rb") as f:
+        h = hashlib.sha1()
+        start = 0
+        if state and st.st_size >= state[2]:
+            if _hash_prefix(f, h, state[2]) and h.hexdigest() == state[3]:
+                start = state[2]
+        if start == 0:
+            h = hashlib.sha1()
+            f.seek(0)
+
+        offset = start
+        skip_header = start == 0
+        lines = []
+        for raw in f:
+            # a last line without newline may still be being written:
+            # import it, but read it again next time
+            if raw.endswith(b"\n"):
+                h.update(raw)
+                offset += len(raw)
+            if skip_header:
+                skip_header = False
+                continue
+            lines.append(raw.decode("utf-8", "replace"))
+            if len(lines) >= IMPORT_CHUNK:
+                skipped += _insert_lines(cur, lines, layout)
+                imported += len(lines)
+                lines = []
+
+        if lines:
+            skipped += _insert_lines(cur, lines, layout)
+            imported += len(lines)
+
+    cur.execute(
+        "INSERT OR REPLACE INTO csv_imports"
+        "(path, size, mtime_ns, offset, prefix_hash) VALUES (?, ?, ?, ?, ?)",
+        (key, st.st_size, st.st_mtime_ns, offset, h.hexdigest())
+    )
+    con.commit()
+    if skipped:
+        print(f"⚠️ {csv_path.name}: {skipped} tokens do not fit the "
+              f"{layout.name} layout and were not imported")
+    return imported - skipped
+
+
+# ================= COUNTERS =================
+def invite_rows(con, layout=TEXT_LAYOUT):
+    # (token, used) for every invite, streamed from the cursor
+    for key, used in con.execute(layout.rows_sql):
+        yield layout.to_token(key), used
+
+
+def read_counters(con):
+    row = con.execute(
+        "SELECT total, used FROM counters WHERE id = 1"
+    ).fetchone()
+    total, used = row if row else (0, 0)
+    return {
+        "total": total,
+        "used": used,
+        "remaining": total - used
+    }
+
+
+# ================= ADMISSION =================
+def admit(con, token, layout=TEXT_LAYOUT):
+    # One conditional write: of two gates racing on the same token,
+    # exactly one sees rowcount == 1.
+    args = _use_args(layout, token, time.time())
+    if args is None:
+        return INVALID, None
+
+    cur = con.execute(layout.use_sql, args)
+    if cur.rowcount == 1:
+        counters = read_counters(con)
+        con.commit()
+        return ADMITTED, counters
+
+    con.rollback()
+    exists = con.execute(layout.exists_sql, (args["key"],)).fetchone()
+    return (ALREADY if exists else INVALID), None
+
+
+def admit_many(con, tokens, layout=TEXT_LAYOUT):
+    # Same rules as admit(), all tokens in a single transaction
+    now = time.time()
+    keys = []
+    results = []
+    for token in tokens:
+        args = _use_args(layout, token, now)
+        keys.append(args and args["key"])
+        if args is None:
+            results.append(INVALID)
+            continue
+        cur = con.execute(layout.use_sql, args)
+        results.append(ADMITTED if cur.rowcount == 1 else None)
+
+    for i, key in enumerate(keys):
+        if results[i] is None:
+            exists = con.execute(layout.exists_sql, (key,)).fetchone()
+            results[i] = ALREADY if exists else INVALID
+
+    counters = read_counters(con)
+    con.commit()
+    return results, counters
+
+
+# ================= ADMISSIONS LOG =================
+def record_admissions(con, entries, layout=TEXT_LAYOUT):
+    # entries: (ts, gate, token, result, client_ts) decided elsewhere
+    # (memory index or an earlier admit()); the used flag update is a no-op
+    # for tokens SQLite already knows are used.
+    used = [_use_args(layout, e[2], e[0]) for e in entries if e[3] == ADMITTED]
+    con.executemany(layout.use_sql, [a for a in used if a is not None])
+    con.executemany(
+        "INSERT INTO admissions(ts, gate, token, result, client_ts) "
+        "VALUES (?, ?, ?, ?, ?)",
+        entries
+    )
+    con.commit()
+
+
+def _admission_filters(gate=None, result=None, since=None, until=None):
+    where, args = [], []
+    if gate is not None:
+        where.append("gate = ?")
+        args.append(gate)
+    if result is not None:
+        where.append("result = ?")
+        args.append(result)
+    if since is not None:
+        where.append("ts >= ?")
+        args.append(since)
+    if until is not None:
+        where.append("ts < ?")
+        args.append(until)
+    return where, args
+
+
+def query_admissions(con, gate=None, result=None, since=None, until=None,
+                     limit=100):
+    # newest first; every filter maps onto one of the (x, ts) indexes,
+    # so this is a range scan however long the log gets
+    where, args = _admission_filters(gate, result, since, until)
+
+    sql = "SELECT ts, gate, token, result, client_ts FROM admissions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts DESC LIMIT ?"
+    args.append(limit)
+
+    return [
+        {
+            "ts": ts,
+            "gate": g,
+            "token": token,
+            "result": r,
+            "client_ts": cts
+        }
+        for ts, g, token, r, cts in con.execute(sql, args)
+    ]
+
+
+def gate_summary(con, since=None, until=None):
+    where, args = [], []
+    if since is not None:
+        where.append("ts >= ?")
+        args.append(since)
+    if until is not None:
+        where.append("ts < ?")
+        args.append(until)
+
+    sql = "SELECT gate, result, COUNT(*) FROM admissions"
+    if where:
+        # range-scan the window instead of walking all of (gate, ts)
+        sql += " INDEXED BY admissions_ts WHERE " + " AND ".join(where)
+    sql += " GROUP BY gate, result"
+
+    gates = {}
+    for gate, result, count in con.execute(sql, args):
+        gates.setdefault(gate or "", {})[result] = count
+    return gates
+
+
+def arrivals(con, minutes, result=ADMITTED, now=None):
+    # the last `minutes` one-minute buckets up to now, zero-filled:
+    # {"minutes": [start, ...], "gates": {gate: [count, ...]}, "total": [...]}
+    end = int((now if now is not None else time.time()) // 60) * 60
+    start = end - (minutes - 1) * 60
+
+    sql = "SELECT minute, gate, SUM(count) FROM arrivals WHERE minute >= ?"
+    args = [start]
+    if result is not None:
+        sql += " AND result = ?"
+        args.append(result)
+    sql += " GROUP BY minute, gate"
+
+    total = [0] * minutes
+    gates = {}
+    for minute, gate, count in con.execute(sql, args):
+        i = (minute - start) // 60
+        if i >= minutes:
+            continue    # logged after `now` (clock stepped back)
+        gates.setdefault(gate, [0] * minutes)[i] = count
+        total[i] += count
+
+    return {
+        "bucket": 60,
+        "minutes": [start + 60 * i for i in range(minutes)],
+        "gates": gates,
+        "total": total
+    }
+
+
+# ================= EXPORT =================
+# Keyset pages: each call is one short read that resumes after the last
+# row of the previous page, so an export never holds a connection or a
+# read transaction between pages and costs the same on page 1 and 500.
+EXPORT_PAGE = 2000
+
+
+def export_invites(con, layout=TEXT_LAYOUT, after=None, used=None,
+                   since=None, until=None, limit=EXPORT_PAGE):
+    # -> [(token, used, admitted_at)], cursor for the next page or None
+    # since / until (unix seconds) select by admission time, which only
+    # INT_LAYOUT records
+    where, args = [], []
+    if after is not None:
+        where.append(f"{layout.key_column} > ?")
+        args.append(after)
+    if used is not None:
+        where.append(f"{layout.used_sql} = ?")
+        args.append(1 if used else 0)
+    if since is not None or until is not None:
+        if layout is not INT_LAYOUT:
+            raise ValueError("text layout has no admission times")
+        where.append("used <> 0")
+    if since is not None:
+        where.append("used >= ?")
+        args.append(int(since * 1000))
+    if until is not None:
+        where.append("used < ?")
+        args.append(int(until * 1000))
+
+    sql = f"SELECT {layout.key_column}, used FROM invites"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {layout.key_column} LIMIT ?"
+    args.append(limit)
+
+    rows = con.execute(sql, args).fetchall()
+    page = [
+        (layout.to_token(key), 1 if raw else 0, layout.admitted_at(raw))
+        for key, raw in rows
+    ]
+    return page, (rows[-1][0] if len(rows) == limit else None)
+
+
+def export_admissions(con, after=None, gate=None, result=None, since=None,
+                      until=None, limit=EXPORT_PAGE):
+    # -> [(ts, gate, token, result, client_ts)] oldest first, cursor
+    # (ts, id) for the next page or None
+    where, args = _admission_filters(gate, result, since, until)
+    if after is not None:
+        where.append("(ts, id) > (?, ?)")
+        args.extend(after)
+
+    sql = "SELECT ts, gate, token, result, client_ts, id FROM admissions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts, id LIMIT ?"
+    args.append(limit)
+
+    rows = con.execute(sql, args).fetchall()
+    page = [row[:5] for row in rows]
+    return page, ((rows[-1][0], rows[-1][5]) if len(rows) == limit else None)
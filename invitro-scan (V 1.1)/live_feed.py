@@ -0,0 +1,73 @@
+import threading
+from collections import deque
+
+# ================= CONFIG =================
+RECENT_SIZE = 50          # admissions kept for clients that fall behind
+KEEPALIVE = 15            # seconds between SSE keep-alive comments
+
+
+# ================= LIVE FEED =================
+# Versioned counters + recent admissions for one event. Scans publish,
+# /stream and /stats/wait subscribers block in wait() until the version
+# moves, so idle clients cost a sleeping thread and nothing else.
+class LiveFeed:
+    def __init__(self, counters, recent=RECENT_SIZE):
+        self._cond = threading.Condition()
+        self._counters = counters
+        self._recent = deque(maxlen=recent)
+        self._listeners = []
+        self.version = 0
+        self.subscribers = 0
+
+    def publish(self, counters, admissions=()):
+        with self._cond:
+            self.version += 1
+            # scans publish after releasing the index lock, so a snapshot
+            # taken earlier can arrive second; used only ever grows
+            if counters["used"] >= self._counters["used"]:
+                self._counters = counters
+            for entry in admissions:
+                self._recent.append(dict(entry, version=self.version))
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for fn in listeners:
+            fn()
+
+    def _snapshot(self, since):
+        return {
+            "version": self.version,
+            "stats": self._counters,
+            "admissions": [
+                a for a in self._recent
+                if since is None or a["version"] > since
+            ]
+        }
+
+    def snapshot(self, since=None):
+        with self._cond:
+            return self._snapshot(since)
+
+    def wait(self, since, timeout):
+        # != rather than >: a client holding a version from before a
+        # server restart gets resynced instead of waiting forever
+        with self._cond:
+            changed = self._cond.wait_for(
+                lambda: self.version != since, timeout
+            )
+            if not changed:
+                return None
+            return self._snapshot(since)
+
+    def add_listener(self, fn):
+        # fn() is called from the publishing thread; must not block
+        with self._cond:
+            self._listeners.append(fn)
+
+    # ---------- subscriber bookkeeping ----------
+    def subscribe(self):
+        with self._cond:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
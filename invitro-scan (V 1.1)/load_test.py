@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# Load generator for sizing scan-server hardware.
+#
+#   python server.py                 (or: python server.py --async)
+#   python load_test.py --tokens 20000 --gates 12 --rate 400 --duration 60
+#
+# Seeds a fresh event, then M simulated gates scan it through the
+# /events/<name>/... routes, so the active event is left untouched.
+# Unless --keep, the event is unregistered afterwards; its files are only
+# deleted once no server holds it open (else they are listed to delete).
+#
+# Latency is measured from when a request was due, not when it was sent:
+# each gate is one sequential client, so time spent waiting for the
+# previous answer counts too (no coordinated omission).
+import argparse
+import csv
+import random
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+import invite_db
+from event_store import INT_TOKENS, StoreLocked, lock_event
+from event_registry import load_events, save_events, event_db_path, event_csv_path
+from tokens import make_token
+
+# ================= CONFIG =================
+SERVER = "http://127.0.0.1:5000"
+TIMEOUT = 10
+
+# share of requests per kind; valid scans fall back to duplicates once
+# every seeded token has been used, duplicates to valid scans until one
+# has been admitted
+MIX = {
+    "valid": 0.70,
+    "duplicate": 0.15,
+    "invalid": 0.10,
+    "stats": 0.05
+}
+
+SETTLE_TIMEOUT = 15      # seconds to wait for the journal to reach SQLite
+RATE_SHORTFALL = 0.9     # warn below this share of the requested rate
+
+
+# ================= SEED =================
+def seed_event(name, count):
+    data = load_events()
+    if name in data["events"]:
+        raise SystemExit(f"❌ Event '{name}' already exists — pick another --event")
+
+    data["events"][name] = {
+        "db": f"{name}.db",
+        "csv": f"{name}_invites.csv"
+    }
+    save_events(data)
+
+    tokens = list({make_token() for _ in range(count)})
+    with open(event_csv_path(name), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["token"])
+        writer.writerows([t] for t in tokens)
+
+    # import here so the server opens the event without a cold CSV import
+    con = sqlite3.connect(event_db_path(name))
+    try:
+        layout = invite_db.ensure_schema(con, compact=INT_TOKENS)
+        invite_db.import_csv(con, event_csv_path(name), layout)
+    finally:
+        con.close()
+
+    return tokens
+
+
+def remove_event(name):
+    db, csv_path = event_db_path(name), event_csv_path(name)
+    data = load_events()
+    data["events"].pop(name, None)
+    save_events(data)
+
+    files = [db, db.with_name(db.name + "-wal"), db.with_name(db.name + "-shm"),
+             db.with_suffix(".journal"), csv_path]
+    lock_path = db.with_suffix(".lock")
+    try:
+        # a server still serving the event holds this; its files stay
+        lock = lock_event(lock_path)
+    except StoreLocked:
+        names = [p.name for p in files + [lock_path] if p.exists()]
+        print(f"⚠️ The server still has '{name}' open — delete "
+              f"{', '.join(names)} once it is stopped")
+        return
+
+    # the .lock file itself stays: unlinking it while held would let a
+    # later opener lock a fresh file next to ours
+    left = []
+    try:
+        for path in files:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                left.append(path.name)
+    finally:
+        lock.close()
+    if left:
+        print(f"⚠️ Could not delete {', '.join(left)}")
+    else:
+        print(f"🧹 Removed event '{name}'")
+
+
+def wait_for_event(base, name):
+    # the server re-reads events.json at most once per CHECK_INTERVAL
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            if name in requests.get(f"{SERVER}/events", timeout=TIMEOUT).json()["events"]:
+                requests.get(f"{base}/stats", timeout=60).raise_for_status()
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"❌ Server at {SERVER} does not see event '{name}'")
+
+
+# ================= GATES =================
+class TokenPool:
+    def __init__(self, tokens):
+        self._lock = threading.Lock()
+        self._fresh = list(tokens)
+        random.shuffle(self._fresh)
+        self._used = []
+
+    def fresh(self):
+        with self._lock:
+            return self._fresh.pop() if self._fresh else None
+
+    def mark_used(self, token):
+        with self._lock:
+            self._used.append(token)
+
+    def used(self):
+        with self._lock:
+            return random.choice(self._used) if self._used else None
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(list)      # kind -> seconds
+        self.errors = defaultdict(int)        # kind -> transport / HTTP errors
+        self.unexpected = defaultdict(int)    # kind -> wrong answer
+        self.admitted = defaultdict(int)      # token -> successful scans seen
+        # valid scans that failed in transit: the server may have admitted
+        # them before the timeout / error, so the DB can count them or not
+        self.uncertain = 0
+
+    def add(self, kind, seconds, error=False, unexpected=False, token=None):
+        with self._lock:
+            self.latency[kind].append(seconds)
+            if error:
+                self.errors[kind] += 1
+                if kind == "valid":
+                    self.uncertain += 1
+            if unexpected:
+                self.unexpected[kind] += 1
+            if token is not None:
+                self.admitted[token] += 1
+
+
+def pick_kind():
+    r = random.random()
+    for kind, share in MIX.items():
+        if r < share:
+            return kind
+        r -= share
+    return "stats"
+
+
+def run_gate(gate, base, pool, results, interval, stop_at):
+    session = requests.Session()
+    due = time.monotonic() + random.uniform(0, interval)
+
+    while due < stop_at:
+        # open loop: keep the schedule even if the server falls behind,
+        # otherwise a slow server would hide its own latency
+        scheduled = due
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        due += interval
+
+        kind = pick_kind()
+        token = None
+        if kind == "duplicate":
+            token = pool.used()
+            if token is None:
+                kind = "valid"
+        if kind == "valid":
+            token = pool.fresh()
+            if token is None:
+                kind, token = "duplicate", pool.used()
+        if kind == "invalid" or (kind != "stats" and token is None):
+            kind, token = "invalid", make_token()
+
+        try:
+            if kind == "stats":
+                r = session.get(f"{base}/stats", timeout=TIMEOUT)
+            else:
+                r = session.post(
+                    f"{base}/scan/{token}",
+                    params={"gate": gate},
+                    timeout=TIMEOUT
+                )
+            elapsed = time.monotonic() - scheduled
+            r.raise_for_status()
+            body = r.json()
+        except (requests.RequestException, ValueError):
+            results.add(kind, time.monotonic() - scheduled, error=True)
+            continue
+
+        if kind == "stats":
+            results.add(kind, elapsed)
+            continue
+
+        ok = body.get("success") is True
+        if ok and kind == "valid":
+            pool.mark_used(token)
+        results.add(
+            kind,
+            elapsed,
+            unexpected=ok != (kind == "valid"),
+            token=token if ok else None
+        )
+
+
+# ================= REPORT =================
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+def report(results, wall, rate):
+    print()
+    print(f"{'kind':<10}{'count':>8}{'errors':>8}{'wrong':>8}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    total = errors = 0
+    everything = []
+    for kind in list(MIX) + ["all"]:
+        if kind == "all":
+            values, err, wrong = everything, errors, sum(results.unexpected.values())
+        else:
+            values = results.latency.get(kind, [])
+            err, wrong = results.errors[kind], results.unexpected[kind]
+            everything += values
+            total += len(values)
+            errors += err
+        print(f"{kind:<10}{len(values):>8}{err:>8}{wrong:>8}"
+              f"{percentile(values, 50) * 1000:>10.1f}"
+              f"{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}")
+
+    print()
+    achieved = total / wall
+    print(f"Throughput : {achieved:.1f} req/s over {wall:.1f}s")
+    print(f"Error rate : {errors / total * 100 if total else 0:.2f}%")
+    if achieved < RATE_SHORTFALL * rate:
+        print(f"⚠️ Asked for {rate:g} req/s, got {achieved:.1f}: the server (or "
+              f"too few --gates) could not keep up, so the latencies above "
+              f"include time requests spent waiting to be sent")
+
+
+# ================= VERIFY =================
+def wait_settled(base):
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            journal = requests.get(f"{base}/store", timeout=TIMEOUT).json()["journal"]
+            if journal["pending"] == 0 and journal["unmerged"] == 0:
+                return True
+        except (requests.RequestException, ValueError, KeyError):
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def verify(name, base, results):
+    ok = True
+
+    doubles = [t for t, n in results.admitted.items() if n > 1]
+    if doubles:
+        ok = False
+        print(f"❌ {len(doubles)} tokens answered OK more than once, e.g. {doubles[:5]}")
+    else:
+        print(f"✅ Responses: {len(results.admitted)} tokens admitted, none twice")
+
+    if not wait_settled(base):
+        print("⚠️ Journal not merged yet — skipping database check")
+        return ok
+
+    con = sqlite3.connect(event_db_path(name))
+    try:
+        rows = con.execute(
+            "SELECT token, COUNT(*) FROM admissions "
+            "WHERE result = ? GROUP BY token HAVING COUNT(*) > 1",
+            (invite_db.ADMITTED,)
+        ).fetchall()
+        used = invite_db.read_counters(con)["used"]
+    finally:
+        con.close()
+
+    admitted, uncertain = len(results.admitted), results.uncertain
+    if rows:
+        ok = False
+        print(f"❌ Database: {len(rows)} tokens with several OK admissions")
+    elif not admitted <= used <= admitted + uncertain:
+        ok = False
+        print(f"❌ Database: {used} used tokens, responses admitted {admitted}"
+              + (f" (+ up to {uncertain} unanswered)" if uncertain else ""))
+    else:
+        print(f"✅ Database: {used} used tokens, no double admissions"
+              + (f" ({used - admitted} of {uncertain} unanswered scans went through)"
+                 if uncertain else ""))
+    return ok
+
+
+# ================= RUN =================
+def run(args, base, tokens):
+    wait_for_event(base, args.event)
+
+    pool = TokenPool(tokens)
+    results = Results()
+    interval = args.gates / args.rate
+
+    print(f"Running {args.gates} gates at {args.rate:g} req/s for {args.duration:g}s")
+    started = time.monotonic()
+    stop_at = started + args.duration
+    threads = [
+        threading.Thread(
+            target=run_gate,
+            args=(f"LT-{i + 1:02d}", base, pool, results, interval, stop_at),
+            daemon=True
+        )
+        for i in range(args.gates)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    report(results, time.monotonic() - started, args.rate)
+    return verify(args.event, base, results)
+
+
+# ================= MAIN =================
+def main():
+    global SERVER
+
+    parser = argparse.ArgumentParser(description="Multi-gate scan load test")
+    parser.add_argument("--server", default=SERVER)
+    parser.add_argument("--event", default=time.strftime("loadtest_%Y%m%d_%H%M%S"))
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--gates", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=200, help="requests/s, all gates")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded event afterwards")
+    args = parser.parse_args()
+
+    SERVER = args.server.rstrip("/")
+    base = f"{SERVER}/events/{args.event}"
+
+    print(f"Seeding event '{args.event}' with {args.tokens} tokens")
+    tokens = seed_event(args.event, args.tokens)
+    try:
+        ok = run(args, base, tokens)
+    finally:
+        if not args.keep:
+            remove_event(args.event)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import threading
+from bisect import bisect_left
+
+# ================= CONFIG =================
+# seconds; scans answered from memory land in the first buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# held open on purpose (push / long-poll / export): counted, not timed
+LONG_ROUTES = {"stream", "stats_wait", "admin_export"}
+
+REGISTRY = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{n}="{v}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# ================= METRIC TYPES =================
+# Minimal Prometheus text-format metrics: one small lock per metric, no
+# allocation on the hot path beyond the first sample of a label set.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for lv, v in values:
+            yield self.name + _labels(self.labels, lv), v
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}    # label values -> [bucket counts..., sum]
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(lv, list(s)) for lv, s in self._series.items()]
+        names = self.labels + ("le",)
+        for lv, s in series:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), s):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket" + _labels(names, lv + (le,)), running
+            yield self.name + "_sum" + _labels(self.labels, lv), s[-1]
+            yield self.name + "_count" + _labels(self.labels, lv), running
+
+
+class Callback:
+    # values read at scrape time: fn() -> iterable of (label values, value)
+    def __init__(self, name, help, fn, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = labels
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def samples(self):
+        try:
+            values = list(self.fn())
+        except Exception:
+            return
+        for lv, v in values:
+            yield self.name + _labels(self.labels, lv), v
+
+
+# ================= APP METRICS =================
+HTTP_REQUESTS = Counter(
+    "invitro_http_requests_total",
+    "HTTP requests by route and status",
+    ("route", "status")
+)
+HTTP_SECONDS = Histogram(
+    "invitro_http_request_seconds",
+    "Wall time to answer a request",
+    ("route",)
+)
+DB_SECONDS = Histogram(
+    "invitro_db_seconds",
+    "Time a request spent holding SQLite connections",
+    ("route",)
+)
+SCANS = Counter(
+    "invitro_scans_total",
+    "Scan outcomes (OK / ALREADY / INVALID)",
+    ("result",)
+)
+
+
+def observe_request(route, status, seconds, db_seconds):
+    HTTP_REQUESTS.inc(route, status)
+    if route in LONG_ROUTES:
+        return
+    HTTP_SECONDS.observe(seconds, route)
+    DB_SECONDS.observe(db_seconds, route)
+
+
+# ================= EXPOSITION =================
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for sample, value in metric.samples():
+            lines.append(f"{sample} {value}")
+    return "\n".join(lines) + "\n"
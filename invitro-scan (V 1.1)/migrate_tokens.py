@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# Converts event DBs to the compact integer token layout
+# (invite_db.INT_LAYOUT). Stop the server first: an event a server has
+# open (it holds <event>.lock) is refused. A journal left by a crash is
+# fine, the next server start replays it into the new layout.
+#
+#   python migrate_tokens.py <event> [<event> ...]
+#   python migrate_tokens.py --all
+import sqlite3
+import sys
+import time
+
+import invite_db
+from event_registry import load_events, event_db_path
+from event_store import StoreLocked, lock_event
+
+
+# ================= MIGRATION =================
+# One transaction: rename the text table away, create the integer one,
+# copy rows across, recount, drop the old table. used becomes the time of
+# the token's first OK admission (migration time if the log has none).
+MIGRATE_SQL = """
+BEGIN IMMEDIATE;
+
+CREATE TEMP TABLE first_ok (token TEXT PRIMARY KEY, ts REAL);
+INSERT INTO first_ok
+    SELECT token, MIN(ts) FROM admissions
+    WHERE result = '{admitted}'
+    GROUP BY token;
+
+DROP TRIGGER IF EXISTS invites_count_insert;
+DROP TRIGGER IF EXISTS invites_count_delete;
+DROP TRIGGER IF EXISTS invites_count_used;
+ALTER TABLE invites RENAME TO invites_text;
+
+{table}
+
+INSERT INTO invites(key, used)
+    SELECT token_key(t.token),
+           CASE WHEN t.used = 1
+                THEN CAST(COALESCE(f.ts, {now}) * 1000 AS INTEGER)
+                ELSE 0 END
+    FROM invites_text t LEFT JOIN first_ok f ON f.token = t.token
+    ORDER BY 1;
+
+DROP TABLE invites_text;
+DROP TABLE first_ok;
+
+UPDATE counters SET
+    total = (SELECT COUNT(*) FROM invites),
+    used = (SELECT COUNT(*) FROM invites WHERE used <> 0)
+WHERE id = 1;
+
+{triggers}
+
+COMMIT;
+"""
+
+
+def migrate(db_path):
+    if not db_path.exists():
+        print(f"❌ {db_path.name}: not found")
+        return False
+
+    # a running server keeps its cached text layout and would fail every
+    # journal merge after the table changes under it; holding the event
+    # lock also keeps one from opening the event mid-migration
+    try:
+        lock = lock_event(db_path.with_suffix(".lock"))
+    except StoreLocked:
+        print(f"❌ {db_path.name}: open in a running server — stop it and try again")
+        return False
+    try:
+        return _migrate(db_path)
+    finally:
+        lock.close()
+
+
+def _migrate(db_path):
+    before = db_path.stat().st_size
+    con = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        layout = invite_db.storage_layout(con)
+        if layout is invite_db.INT_LAYOUT:
+            print(f"✅ {db_path.name}: already compact")
+            return True
+        if layout is None:
+            print(f"❌ {db_path.name}: no invites table")
+            return False
+
+        bad = [
+            token for (token,) in con.execute("SELECT token FROM invites")
+            if invite_db.INT_LAYOUT.to_key(token) is None
+        ]
+        if bad:
+            print(f"❌ {db_path.name}: {len(bad)} tokens are not 12 hex "
+                  f"digits (e.g. {bad[0]!r}), left as text")
+            return False
+
+        con.create_function(
+            "token_key", 1, invite_db.INT_LAYOUT.to_key, deterministic=True
+        )
+        try:
+            con.executescript(MIGRATE_SQL.format(
+                admitted=invite_db.ADMITTED,
+                now=time.time(),
+                table=invite_db.INT_LAYOUT.table,
+                triggers=invite_db.INT_LAYOUT.triggers
+            ))
+        except sqlite3.Error:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+
+        con.execute("VACUUM")
+        counters = invite_db.read_counters(con)
+    finally:
+        con.close()
+
+    after = db_path.stat().st_size
+    print(f"✅ {db_path.name}: {counters['total']} invites "
+          f"({counters['used']} used), {before // 1024} KB → {after // 1024} KB")
+    return True
+
+
+# ================= MAIN =================
+def main(args):
+    if args == ["--all"]:
+        args = sorted(load_events()["events"])
+    if not args:
+        print("usage: migrate_tokens.py <event> [<event> ...] | --all")
+        return 1
+
+    ok = True
+    for name in args:
+        try:
+            ok = migrate(event_db_path(name)) and ok
+        except KeyError:
+            print(f"❌ Unknown event: {name}")
+            ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,116 @@
+import time
+
+import cv2
+
+try:
+    from pyzbar import pyzbar
+except (ImportError, OSError):      # package or the zbar library missing
+    pyzbar = None
+
+# ================= CONFIG =================
+DETECT_W = 640          # width the OpenCV search runs at
+ROI_MARGIN = 0.15       # share of the code size added around a found region
+RELIABLE_SHARE = 0.9    # calibration: hit rate needed, relative to the best
+
+
+def to_gray(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
+# ================= BACKENDS =================
+# One instance per decode thread (detectors are not thread safe).
+# decode(gray) -> list of decoded strings.
+class OpenCVDecoder:
+    name = "opencv"
+
+    def __init__(self):
+        self.detector = cv2.QRCodeDetector()
+
+    def locate(self, small):
+        ok, quads = self.detector.detect(small)
+        return quads if ok else None
+
+    def decode(self, gray):
+        # locate on a downscaled copy, decode each found region at full
+        # resolution
+        h, w = gray.shape
+        scale = min(1.0, DETECT_W / w)
+        small = gray if scale == 1 else cv2.resize(
+            gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+        quads = self.locate(small)
+        if quads is None:
+            return []
+
+        found = []
+        for quad in quads.reshape(-1, 4, 2) / scale:
+            (x0, y0), (x1, y1) = quad.min(0), quad.max(0)
+            pad = ROI_MARGIN * max(x1 - x0, y1 - y0)
+            x0, y0 = max(0, int(x0 - pad)), max(0, int(y0 - pad))
+            x1, y1 = min(w, int(x1 + pad) + 1), min(h, int(y1 + pad) + 1)
+            text = self.detector.detectAndDecode(gray[y0:y1, x0:x1])[0]
+            if text:
+                found.append(text)
+        return found
+
+
+class OpenCVMultiDecoder(OpenCVDecoder):
+    # several codes per frame (group arrivals), single detect as fallback
+    name = "opencv-multi"
+
+    def locate(self, small):
+        ok, quads = self.detector.detectMulti(small)
+        return quads if ok else super().locate(small)
+
+
+class PyzbarDecoder:
+    name = "pyzbar"
+
+    def decode(self, gray):
+        return [
+            s.data.decode("utf-8", "replace")
+            for s in pyzbar.decode(gray, symbols=[pyzbar.ZBarSymbol.QRCODE])
+        ]
+
+
+BACKENDS = {
+    OpenCVDecoder.name: OpenCVDecoder,
+    OpenCVMultiDecoder.name: OpenCVMultiDecoder
+}
+if pyzbar is not None:
+    BACKENDS[PyzbarDecoder.name] = PyzbarDecoder
+
+DEFAULT = OpenCVMultiDecoder.name
+
+
+# ================= CALIBRATION =================
+def benchmark(frames):
+    # -> [{"backend", "ms", "hit_rate"}] over the same frames
+    grays = [to_gray(f) for f in frames]
+    results = []
+    for name, cls in BACKENDS.items():
+        decoder = cls()
+        decoder.decode(grays[0])        # warm-up, not timed
+        hits = 0
+        started = time.perf_counter()
+        for gray in grays:
+            try:
+                hits += bool(decoder.decode(gray))
+            except cv2.error:
+                pass
+        results.append({
+            "backend": name,
+            "ms": (time.perf_counter() - started) * 1000 / len(grays),
+            "hit_rate": hits / len(grays)
+        })
+    return results
+
+
+def pick(results, current):
+    # fastest backend whose hit rate is close to the best one; with no
+    # code in any sample there is nothing to judge reliability by
+    best = max(r["hit_rate"] for r in results)
+    if best == 0:
+        return current
+    reliable = [r for r in results if r["hit_rate"] >= RELIABLE_SHARE * best]
+    return min(reliable, key=lambda r: r["ms"])["backend"]
@@ -1,10 +1,6 @@
 #!/usr/bin/env python3
 import os
-import uuid
 import csv
-import json
-import sys
-from pathlib import Path
 
 import qrcode
 from PIL import Image
@@ -12,22 +8,12 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 
+import tokens
+from event_registry import BASE_DIR, load_events, save_events, event_csv_path
 
-# ================= BASE DIR (exe-safe) =================
-def app_base_dir():
-    if getattr(sys, 'frozen', False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent
-
-
-BASE_DIR = app_base_dir()
 
 # ================= PATHS =================
-DATA_DIR = BASE_DIR / "data"
 QRS_DIR = BASE_DIR / "qrs"
-EVENTS_FILE = DATA_DIR / "events.json"
-
-DATA_DIR.mkdir(exist_ok=True)
 QRS_DIR.mkdir(exist_ok=True)
 
 # ================= CONFIG =================
@@ -43,17 +29,22 @@ SLIP_H = 60 * mm
 
 QR_SIZE = int(48 * mm)        # large & readable
 
+# Print <token>-<tag> (see tokens.py) so gates can reject forged codes
+# without asking the server. The CSV still holds the plain token.
+SIGN_TOKENS = True
+
 
 # ================= HELPERS =================
-def load_events():
-    if not EVENTS_FILE.exists():
-        raise RuntimeError("events.json not found")
-    with open(EVENTS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+make_token = tokens.make_token
 
 
-def make_token():
-    return uuid.uuid4().hex[:12].upper()
+def event_key(events, name):
+    # per-event signing key, created on first use
+    cfg = events["events"][name]
+    if not cfg.get("token_key"):
+        cfg["token_key"] = tokens.new_key()
+        save_events(events)
+    return cfg["token_key"]
 
 
 # ================= MAIN =================
@@ -69,17 +60,19 @@ def generate_qrs():
     event_qr_dir = QRS_DIR / active
     event_qr_dir.mkdir(exist_ok=True)
 
-    csv_file = BASE_DIR / f"{active}_invites.csv"
+    csv_file = event_csv_path(active)
     pdf_file = BASE_DIR / f"{active}_qr_slips.pdf"
 
     records = []
+    key = event_key(events, active) if SIGN_TOKENS else None
 
     print(f"Generating {COUNT} QR codes for event '{active}'")
 
     # ---------- QR GENERATION ----------
     for i in range(COUNT):
         token = make_token()
-        url = f"{BASE_URL}/{token}"
+        printed = tokens.sign(token, key) if key else token
+        url = f"{BASE_URL}/{printed}"
 
         img_path = event_qr_dir / f"{token}.png"
 
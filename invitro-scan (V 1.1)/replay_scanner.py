@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# Headless replay of the gate pipeline, for repeatable decode benchmarks.
+#
+#   python replay_scanner.py clip.mp4
+#   python replay_scanner.py frames/ --fps 15 --backend pyzbar
+#   python replay_scanner.py clip.mp4 --server http://127.0.0.1:5000
+#
+# Frames from a video file or an image directory go through scanner_ui's
+# capture / decode / triage / network stages at the recording's frame
+# rate, without a window. Scans are answered by a stub unless --server
+# is given (that server really admits the tokens).
+#
+# A reference pass first decodes every frame with every backend to find
+# the frame each code becomes readable in; the report measures the live
+# pipeline against it. Exits 1 when the pipeline missed a code.
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+
+import cv2
+import requests
+
+import qr_decoders
+import scanner_ui as ui
+
+# ================= CONFIG =================
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp")
+DEFAULT_FPS = 30         # image directories, and videos without a rate
+SETTLE = 1.0             # seconds after the last frame for decodes in flight
+DRAIN_TIMEOUT = 10       # give up on server replies after this many seconds
+
+
+# ================= SOURCE =================
+def read_frames(path):
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(IMAGE_EXTS):
+                frame = cv2.imread(os.path.join(path, name))
+                if frame is not None:
+                    yield frame
+        return
+
+    cap = cv2.VideoCapture(path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def source_fps(path):
+    if os.path.isdir(path):
+        return DEFAULT_FPS
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"❌ Cannot open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps or DEFAULT_FPS
+
+
+class ReplaySource:
+    # cv2.VideoCapture look-alike for ui.capture_loop: frame i is handed
+    # out at started + i / fps, as a camera would
+    def __init__(self, path, fps):
+        self._frames = read_frames(path)
+        self.fps = fps
+        self.started = None
+        self.count = 0
+        self.done = False
+
+    def read(self):
+        frame = next(self._frames, None)
+        if frame is None:
+            self.done = True
+            return False, None
+        if self.started is None:
+            self.started = time.monotonic()
+        delay = self.started + self.count / self.fps - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.count += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+# ================= REFERENCE =================
+def reference(path):
+    # code -> index of the first frame any backend (or a full-resolution
+    # OpenCV pass) reads it in
+    decoders = [cls() for cls in qr_decoders.BACKENDS.values()]
+    full = cv2.QRCodeDetector()
+    first = {}
+    count = 0
+    for i, frame in enumerate(read_frames(path)):
+        gray = qr_decoders.to_gray(frame)
+        codes = []
+        for decoder in decoders:
+            try:
+                codes += decoder.decode(gray)
+            except cv2.error:
+                pass
+        try:
+            ok, decoded, _, _ = full.detectAndDecodeMulti(gray)
+            codes += [c for c in decoded if c] if ok else []
+        except cv2.error:
+            pass
+        for code in codes:
+            first.setdefault(code, i)
+        count = i + 1
+    return first, count
+
+
+# ================= STUB SERVER =================
+def stub_worker(net_q, replies_q, timings):
+    # stands in for ui.net_worker: every token is an invite, admitted once
+    admitted = set()
+    while True:
+        batch, _ = net_q.get()
+        results = []
+        for token, wire in batch:
+            ok = token not in admitted
+            admitted.add(token)
+            results.append({
+                "token": wire,
+                "success": ok,
+                "msg": "OK" if ok else "ALREADY ENTERED"
+            })
+        replies_q.put(("server", batch, {
+            "results": results,
+            "stats": {"total": 0, "used": len(admitted), "remaining": 0}
+        }))
+
+
+# ================= REPLAY =================
+def replay(path, fps, backend, server):
+    source = ReplaySource(path, fps)
+    camera = {"open": lambda: source, "restart": False, "stop": False}
+    latest = {"lock": threading.Lock(), "frame": None, "seq": 0}
+    decode_q = queue.Queue(maxsize=ui.DECODE_WORKERS)
+    found_q = queue.Queue(maxsize=64)
+    net_q = queue.Queue(maxsize=ui.NET_QUEUE)
+    replies_q = queue.Queue()
+    cost = {"s": 0.0, "n": 0}
+    decoder = {"name": backend}
+    timings = ui.new_timings()
+
+    offline = {"snap": None, "slot": 0, "pending": [], "key": None, "lock": threading.Lock()}
+    if server:
+        try:
+            ui.fetch_token_key(offline, requests.Session())
+        except (requests.RequestException, ValueError):
+            print("⚠️ No token key from the server — signatures are left to it")
+
+    threading.Thread(target=ui.capture_loop, args=(camera, latest, timings), daemon=True).start()
+    for _ in range(ui.DECODE_WORKERS):
+        threading.Thread(
+            target=ui.decode_worker, args=(decode_q, found_q, cost, decoder, timings), daemon=True
+        ).start()
+    threading.Thread(
+        target=ui.net_worker if server else stub_worker, args=(net_q, replies_q, timings), daemon=True
+    ).start()
+
+    sched = ui.new_schedule()
+    samples = deque(maxlen=1)
+    last_seen, used_local, held = {}, set(), []
+    stats = {"total": 0, "used": 0, "remaining": 0}
+    first_seen = {}         # code -> monotonic time the render loop got it
+    outcomes = Counter()
+    outstanding = 0
+    ended = None
+
+    # the render loop of ui.main(), minus the drawing
+    while True:
+        with latest["lock"]:
+            frame, seq = latest["frame"], latest["seq"]
+        ui.submit_frame(sched, frame, seq, decode_q, cost, samples)
+
+        now = time.monotonic()
+        codes = [c for found in ui.drain(found_q) for c in found]
+        for code in codes:
+            first_seen.setdefault(code, now)
+
+        batch, decided, _ = ui.triage(codes, last_seen, offline, used_local)
+        ui.send_batch(net_q, held, batch)
+        if batch:
+            outstanding += 1
+        for reply in ui.drain(replies_q):
+            outstanding -= 1
+            decided += ui.reply_outcomes(reply, offline, used_local, stats)
+        for _, status, _ in decided:
+            outcomes[status] += 1
+
+        if source.done:
+            if ended is None:
+                ended = now
+            if (now - ended >= SETTLE and outstanding == 0) or now - ended > DRAIN_TIMEOUT:
+                break
+        time.sleep(1 / ui.RENDER_FPS)
+
+    camera["stop"] = True
+    return {
+        "source": source,
+        "wall": ended - source.started if source.started else 0.0,
+        "decoded": cost["n"],
+        "decode_ms": cost["s"] * 1000,
+        "first_seen": first_seen,
+        "outcomes": outcomes,
+        "timings": ui.timing_summary(timings)
+    }
+
+
+# ================= REPORT =================
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+def report(first, run, fps):
+    source = run["source"]
+    wall = max(run["wall"], 1e-9)
+    print()
+    print(f"Frames     : {source.count} at {fps:g} fps, replayed in {wall:.1f}s")
+    print(f"Decoded    : {run['decoded']} frames ({run['decoded'] / wall:.1f} fps), "
+          f"~{run['decode_ms']:.1f} ms each")
+
+    print()
+    print(f"{'code':<34}{'frame':>8}{'first decode ms':>18}")
+    delays = []
+    missed = []
+    for code, index in sorted(first.items(), key=lambda kv: kv[1]):
+        seen = run["first_seen"].get(code)
+        if seen is None:
+            missed.append(code)
+            shown = "MISSED"
+        else:
+            delay = seen - (source.started + index / fps)
+            delays.append(delay)
+            shown = f"{delay * 1000:.0f}"
+        print(f"{code[:32]:<34}{index:>8}{shown:>18}")
+
+    extra = [c for c in run["first_seen"] if c not in first]
+    print()
+    print(f"Codes      : {len(first) - len(missed)}/{len(first)} decoded, {len(missed)} missed"
+          + (f", {len(extra)} only seen live" if extra else ""))
+    print(f"First decode: p50 {percentile(delays, 50) * 1000:.0f} ms, "
+          f"p95 {percentile(delays, 95) * 1000:.0f} ms")
+    print("Outcomes   : " + (", ".join(f"{k} {v}" for k, v in sorted(run["outcomes"].items())) or "none"))
+    print("Stages     : " + ", ".join(
+        f"{s} {p50:.1f}/{p95:.1f} ms" for s, (p50, p95) in run["timings"].items()
+        if s != "capture"   # replay pacing, not the camera
+    ))
+    return not missed
+
+
+# ================= MAIN =================
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the scanner pipeline")
+    parser.add_argument("source", help="video file or directory of images")
+    parser.add_argument("--fps", type=float, help="replay rate (default: the video's own)")
+    parser.add_argument("--backend", default=qr_decoders.DEFAULT, choices=sorted(qr_decoders.BACKENDS))
+    parser.add_argument("--server", help="scan server to submit to (default: a local stub)")
+    args = parser.parse_args()
+
+    fps = args.fps or source_fps(args.source)
+    if args.server:
+        ui.SERVER = args.server.rstrip("/")
+        ui.GATE_ID = "replay"
+
+    print(f"Reference pass over {args.source}")
+    first, count = reference(args.source)
+    if not count:
+        raise SystemExit(f"❌ No frames in {args.source}")
+    print(f"{count} frames, {len(first)} readable codes")
+
+    print(f"Replaying with {args.backend}, {ui.DECODE_WORKERS} decode workers")
+    run = replay(args.source, fps, args.backend, args.server)
+    if not report(first, run, fps):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
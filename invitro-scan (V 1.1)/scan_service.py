@@ -0,0 +1,404 @@
+import atexit
+import csv
+import io
+import json
+
+import invite_db
+import metrics
+from tokens import verify as verify_token
+from admission_journal import JournalError
+from db_pool import ConnectionPool
+from event_store import EventStore, StoreCache, StoreClosed, StoreLocked
+from event_registry import (
+    load_events,
+    get_active_event,
+    get_event,
+    event_db_path,
+    event_csv_path
+)
+
+# ================= DB POOL =================
+# Tunables (synchronous, cache, idle connections) live in db_pool.py.
+POOL = ConnectionPool()
+
+# ================= ERRORS =================
+class RequestError(Exception):
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.msg = msg
+        self.status = status
+
+# ================= EVENT STORES =================
+# LRU of open events: the active one plus whatever /events/<name>/...
+# routes touched recently, bounded by count and index memory.
+def open_store(name):
+    return EventStore(
+        name,
+        event_db_path(name),
+        event_csv_path(name),
+        POOL
+    )
+
+def active_event_or_none():
+    try:
+        return get_active_event()
+    except RuntimeError:
+        return None
+
+STORES = StoreCache(
+    open_store,
+    keep=lambda name: name == active_event_or_none()
+)
+
+def get_store(event=None):
+    if event is None:
+        event = get_active_event()
+    else:
+        try:
+            get_event(event)
+        except KeyError:
+            raise RequestError(f"Unknown event: {event}", 404)
+    try:
+        return STORES.get(event)
+    except StoreLocked as e:
+        raise RequestError(str(e), 500)
+
+def with_store(event, fn):
+    # a store evicted between lookup and use refuses new work: look again
+    while True:
+        store = get_store(event)
+        try:
+            return fn(store)
+        except StoreClosed:
+            continue
+        except JournalError as e:
+            raise RequestError(str(e), 500)
+
+@atexit.register
+def close_stores():
+    STORES.close_all()
+
+def event_config(event=None):
+    name = event or get_active_event()
+    try:
+        return name, get_event(name)
+    except KeyError:
+        raise RequestError(f"Unknown event: {name}", 404)
+
+def token_check(event=None):
+    # signed-token check (tokens.py) for one event: forged or foreign
+    # codes are refused here, before any store / DB work
+    _, cfg = event_config(event)
+    key = cfg.get("token_key")
+    signed_only = cfg.get("signed_only", False)
+    return lambda token: verify_token(token, key, signed_only)
+
+def init():
+    try:
+        get_store()
+    except RuntimeError:
+        # No active event yet → admin must create one
+        pass
+
+# ================= METRICS GAUGES =================
+def _pool_connections():
+    dbs = POOL.stats()["databases"].values()
+    return [
+        (("idle",), sum(d["idle"] for d in dbs)),
+        (("in_use",), sum(d["in_use"] for d in dbs))
+    ]
+
+def _per_store(fn):
+    return lambda: [((s.name,), fn(s)) for s in STORES.open_stores()]
+
+metrics.Callback(
+    "invitro_pool_connections", "Pooled SQLite connections",
+    _pool_connections, ("state",)
+)
+metrics.Callback(
+    "invitro_pool_opened_total", "SQLite connections opened",
+    lambda: [((), POOL.opened)], kind="counter"
+)
+metrics.Callback(
+    "invitro_pool_reused_total", "Pooled connections handed out again",
+    lambda: [((), POOL.reused)], kind="counter"
+)
+metrics.Callback(
+    "invitro_open_events", "Event stores currently open",
+    lambda: [((), len(STORES.open_stores()))]
+)
+metrics.Callback(
+    "invitro_journal_pending", "Scans queued for the next journal fsync",
+    _per_store(lambda s: s.journal.stats()["pending"]), ("event",)
+)
+metrics.Callback(
+    "invitro_journal_unmerged", "Journalled scans not yet merged into SQLite",
+    _per_store(lambda s: s.journal.stats()["unmerged"]), ("event",)
+)
+metrics.Callback(
+    "invitro_stream_subscribers", "Connected /stream and long-poll clients",
+    _per_store(lambda s: s.feed.subscribers), ("event",)
+)
+metrics.Callback(
+    "invitro_store_memory_bytes", "Estimated index + cache memory",
+    _per_store(lambda s: s.memory_bytes()), ("event",)
+)
+
+# ================= HANDLERS =================
+# Plain functions returning JSON-ready dicts, shared by the Flask app
+# (server.py) and the async server (asgi_server.py). event=None means the
+# active event; /events/<name>/... routes pass the name.
+def scan(token, gate=None, event=None):
+    plain = token_check(event)(token)
+    if plain is None:
+        metrics.SCANS.inc(invite_db.INVALID)
+        return {"success": False, "msg": invite_db.MESSAGES[invite_db.INVALID]}
+
+    result, counters = with_store(event, lambda s: s.admit(plain, gate))
+
+    if result != invite_db.ADMITTED:
+        return {"success": False, "msg": invite_db.MESSAGES[result]}
+
+    return {"success": True, "remaining": counters["remaining"]}
+
+# Group arrivals / queued gate traffic: many tokens, one transaction,
+# per-token results plus fresh stats in a single response.
+MAX_BATCH = 500
+
+def scan_batch(body, event=None):
+    body = body if isinstance(body, dict) else {}
+    gate = body.get("gate")
+
+    scans = body.get("scans")
+    if scans is None:
+        scans = [{"token": t} for t in body.get("tokens", [])]
+
+    if (not isinstance(scans, list)
+            or not 0 < len(scans) <= MAX_BATCH
+            or not all(isinstance(s, dict) for s in scans)):
+        raise RequestError(f"Send 1-{MAX_BATCH} scans")
+
+    tokens = [str(s.get("token", "")).strip() for s in scans]
+    client_ts = [
+        s.get("ts") if isinstance(s.get("ts"), (int, float)) else None
+        for s in scans
+    ]
+    check = token_check(event)
+    plain = [check(t) for t in tokens]
+    todo = [i for i, p in enumerate(plain) if p is not None]
+
+    results = [invite_db.INVALID] * len(tokens)
+    if len(todo) < len(tokens):
+        metrics.SCANS.inc(invite_db.INVALID, amount=len(tokens) - len(todo))
+    if todo:
+        admitted, counters = with_store(event, lambda s: s.admit_many(
+            [plain[i] for i in todo], gate, [client_ts[i] for i in todo]
+        ))
+        for i, result in zip(todo, admitted):
+            results[i] = result
+    else:
+        counters = stats(event)
+
+    return {
+        "success": True,
+        "gate": gate,
+        "results": [
+            {
+                "token": token,
+                "ts": s.get("ts"),
+                "success": result == invite_db.ADMITTED,
+                "result": result,
+                "msg": invite_db.MESSAGES[result]
+            }
+            for token, s, result in zip(tokens, scans, results)
+        ],
+        "stats": counters
+    }
+
+def stats(event=None):
+    return with_store(event, lambda s: s.counters())
+
+def stats_wait(since, timeout, event=None):
+    # long-poll: blocks until the counters move or timeout runs out
+    feed = get_store(event).feed
+    timeout = min(timeout, 60)
+
+    snap = None
+    if since is not None:
+        snap = feed.wait(since, timeout)
+    return snap or feed.snapshot(since)
+
+def sse_message(snap):
+    return (
+        f"id: {snap['version']}\n"
+        f"event: stats\n"
+        f"data: {json.dumps(snap)}\n\n"
+    )
+
+def snapshot(if_none_match=None, event=None):
+    # -> (etag, bytes), bytes is None when the client copy is current
+    etag, data = with_store(event, lambda s: s.snapshot())
+    if if_none_match == etag:
+        return etag, None
+    return etag, data
+
+DASHBOARD_MINUTES = 30
+
+def dashboard(event=None):
+    def build(store):
+        recent = store.activity(result=invite_db.ADMITTED, limit=20)
+        return dict(
+            **store.counters(),
+            recent_used=[r["token"] for r in recent],
+            recent=recent,
+            arrivals=store.arrivals(DASHBOARD_MINUTES)
+        )
+    return with_store(event, build)
+
+def query_number(query, name, kind=float):
+    value = query.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return kind(value)
+    except ValueError:
+        raise RequestError(f"Bad number for {name}: {value}")
+
+MAX_ACTIVITY = 1000
+
+def activity(query, event=None):
+    # ?gate=&result=&since=&until=&limit=  (since/until: unix seconds)
+    limit = query_number(query, "limit", int) or 100
+    filters = dict(
+        gate=query.get("gate") or None,
+        result=query.get("result") or None,
+        since=query_number(query, "since"),
+        until=query_number(query, "until"),
+        limit=max(1, min(limit, MAX_ACTIVITY))
+    )
+    return with_store(event, lambda s: {"admissions": s.activity(**filters)})
+
+def gates(query, event=None):
+    since = query_number(query, "since")
+    until = query_number(query, "until")
+    return with_store(
+        event, lambda s: {"gates": s.gate_summary(since, until)}
+    )
+
+MAX_ARRIVAL_MINUTES = 24 * 60
+
+def arrivals(query, event=None):
+    # ?minutes=N (default 60) &result=OK|ALREADY|INVALID|all (default OK)
+    minutes = query_number(query, "minutes", int) or 60
+    minutes = max(1, min(minutes, MAX_ARRIVAL_MINUTES))
+    result = query.get("result") or invite_db.ADMITTED
+    if result == "all":
+        result = None
+    return with_store(event, lambda s: s.arrivals(minutes, result))
+
+def token_key(event=None):
+    # scanners verify signed tokens themselves with this
+    name, cfg = event_config(event)
+    return {
+        "event": name,
+        "key": cfg.get("token_key"),
+        "signed_only": cfg.get("signed_only", False)
+    }
+
+# ================= EXPORT =================
+# Attendance (invites) or the admissions log as CSV / NDJSON, streamed a
+# keyset page at a time: constant memory, and each page is a short read
+# between scans rather than one long one.
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson"
+}
+EXPORT_COLUMNS = {
+    "invites": ("token", "used", "admitted_at"),
+    "admissions": ("ts", "gate", "token", "result", "client_ts")
+}
+
+def _csv_chunk(rows):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+def _ndjson_chunk(columns, rows):
+    return "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+def export(query, event=None):
+    # ?kind=invites|admissions &format=csv|ndjson
+    #   invites   : &used=0|1 &since= &until=
+    #               (since / until need the compact layout: the text
+    #               layout does not record when a token was admitted)
+    #   admissions: &gate= &result= &since= &until=
+    # -> (content type, file name, iterator of str chunks)
+    kind = query.get("kind") or "invites"
+    fmt = query.get("format") or "csv"
+    if kind not in EXPORT_COLUMNS:
+        raise RequestError(f"Unknown export kind: {kind}")
+    if fmt not in EXPORT_FORMATS:
+        raise RequestError(f"Unknown export format: {fmt}")
+
+    if kind == "invites":
+        used = query.get("used")
+        if used not in (None, "", "0", "1"):
+            raise RequestError(f"Bad value for used: {used}")
+        used = None if used in (None, "") else used == "1"
+        since = query_number(query, "since")
+        until = query_number(query, "until")
+        page = lambda s, after: s.export_invites(after, used, since, until)
+    else:
+        filters = dict(
+            gate=query.get("gate") or None,
+            result=query.get("result") or None,
+            since=query_number(query, "since"),
+            until=query_number(query, "until")
+        )
+        page = lambda s, after: s.export_admissions(after, **filters)
+
+    # resolve the event now, so a bad name is a 404 rather than a
+    # stream that stops after the headers
+    name, _ = event_config(event)
+    if kind == "invites" and (since is not None or until is not None):
+        layout = with_store(name, lambda s: s.layout)
+        if layout is not invite_db.INT_LAYOUT:
+            raise RequestError(
+                "since / until need the compact token layout "
+                "(migrate_tokens.py): this event does not record admission times"
+            )
+    columns = EXPORT_COLUMNS[kind]
+
+    def chunks():
+        if fmt == "csv":
+            yield _csv_chunk([columns])
+        after = None
+        while True:
+            rows, after = with_store(name, lambda s: page(s, after))
+            if rows:
+                yield (_csv_chunk(rows) if fmt == "csv"
+                       else _ndjson_chunk(columns, rows))
+            if after is None:
+                return
+
+    return EXPORT_FORMATS[fmt], f"{name}_{kind}.{fmt}", chunks()
+
+def list_events():
+    data = load_events()
+    return {
+        "active": data.get("active"),
+        "events": sorted(data["events"]),
+        "open": STORES.stats()["open"]
+    }
+
+def metrics_text():
+    return metrics.render()
+
+def pool_stats():
+    return POOL.stats()
+
+def store_stats(event=None):
+    return with_store(event, lambda s: s.stats())
+
+def cache_stats():
+    return STORES.stats()
@@ -5,21 +5,74 @@ import requests
 import csv
 import os
 import json
+import queue
+import threading
+from collections import deque
 from datetime import datetime
 import platform
 import numpy as np
 from urllib.parse import urlparse
 
+try:
+    import simpleaudio
+except ImportError:
+    simpleaudio=None
+if platform.system()=="Windows":
+    import winsound
+
+import qr_decoders
+from token_snapshot import TokenSnapshot
+from tokens import verify as verify_token, strip as strip_token
+
 SERVER = "http://127.0.0.1:5000"
 SETTINGS_FILE = "settings.json"
 CACHE_FILE = "scan_log_backup.csv"
 CACHE_TTL = 1.2
 KEY_FILE = "keybinds.txt"
+GATE_ID = platform.node() or "gate"
+STREAM_TIMEOUT = 30
+SNAPSHOT_FILES = ("token_snapshot_a.bin","token_snapshot_b.bin")
+PENDING_FILE = "offline_scans.jsonl"
+TOKEN_KEY_FILE = "token_key.json"
+SYNC_INTERVAL = 5
+SYNC_BATCH = 500
+
+# pipeline: capture thread -> decode workers -> render loop -> network worker
+DECODE_WORKERS = max(1,min(4,(os.cpu_count() or 2)-1))
+NET_QUEUE = 8           # batches handed to the network worker; more wait in hand
+NET_TIMEOUT = (1,2)     # connect, read seconds per request
+NET_DEADLINE = 2.5      # batches queued longer than this are not sent (rescan)
+
+# adaptive decode: only decode often while something moves (the search /
+# region refine itself lives in qr_decoders)
+MOTION_SIZE = (80,60)   # thumbnail compared frame to frame
+MOTION_DELTA = 20       # grey levels a thumbnail pixel must change by
+MOTION_PIXELS = 0.01    # share of changed pixels that counts as motion
+MOTION_HOLD = 1.5       # seconds of full-rate decoding after the last motion
+IDLE_DECODE = 1.0       # seconds between decodes of a still scene
+DECODE_BUDGET = 0.6     # share of the workers' time spent decoding, at most
+CALIBRATION_FRAMES = 12 # recent moving frames each backend is timed on
+CALIBRATION_SHOW = 8    # seconds the calibration table stays on screen
+
+# per-stage timing: rolling p50/p95 in the sidebar ("timings" key) and a
+# CSV sample every TIMING_LOG_INTERVAL seconds
+STAGES = ("capture","resize","decode","http","draw","frame")
+TIMING_WINDOW = 300     # samples kept per stage
+TIMING_REFRESH = 0.5    # seconds between overlay updates
+TIMING_LOG = "scanner_timings.csv"
+TIMING_LOG_INTERVAL = 60
+RENDER_FPS = 30
 
 VIDEO_W, VIDEO_H = 1080, 640
 PANEL_W, HEADER_H = 400, 120
 WIN_W = VIDEO_W + PANEL_W + 80
 WIN_H = VIDEO_H + HEADER_H + 100
+VIDEO_X, VIDEO_Y = 40, HEADER_H + 50
+PANEL_X = VIDEO_X + VIDEO_W + 30
+
+FONT = cv2.FONT_HERSHEY_DUPLEX
+TEXT_CACHE = 256        # rendered text patches kept (clock, counters, history)
+LASER_PAD = 5           # half height of the blended laser strip
 
 BG = (22,18,18)
 CARD = (42,34,34)
@@ -32,7 +85,8 @@ GRAY = (150,150,150)
 
 DEFAULT_SETTINGS = {
     "exit_password":"0000",
-    "admin_pin":"0000"
+    "admin_pin":"0000",
+    "decoder":qr_decoders.DEFAULT
 }
 
 
@@ -64,7 +118,9 @@ def load_keys():
         "snapshot":"s",
         "restart":"r",
         "admin":"p",
-        "clear_cache":"c"
+        "clear_cache":"c",
+        "calibrate":"k",
+        "timings":"t"
     }
     if not os.path.exists(KEY_FILE):
         with open(KEY_FILE,"w") as f:
@@ -78,20 +134,449 @@ def load_keys():
                 keys[k]=v.lower()
     return keys
 
-if platform.system()=="Windows":
-    import winsound
-    def beep_ok(): winsound.Beep(1200,120)
-    def beep_fail(): winsound.Beep(400,300)
-else:
-    def beep_ok(): pass
-    def beep_fail(): pass
+# ---------------- AUDIO ---------------- #
+# Tones are synthesized once at startup and played without blocking:
+# simpleaudio mixes on its own thread; without it, Windows falls back to
+# winsound.Beep on a single worker thread (extra tones dropped while it
+# is busy). No simpleaudio and not Windows: silent, as before.
+SAMPLE_RATE = 44100
+AUDIO_VOLUME = 0.5
+TONES = {                               # (Hz, seconds) parts
+    "ok":[(1200,0.12)],
+    "already":[(800,0.1),(600,0.15)],
+    "fail":[(400,0.3)]
+}
+
+def synth(parts):
+    chunks=[]
+    for freq,secs in parts:
+        t=np.arange(int(SAMPLE_RATE*secs))/SAMPLE_RATE
+        ramp=np.minimum(1,np.minimum(t,secs-t)/0.005)    # 5 ms fades, no clicks
+        chunks.append(np.sin(2*np.pi*freq*t)*ramp)
+    return (np.concatenate(chunks)*AUDIO_VOLUME*32767).astype(np.int16).tobytes()
+
+def beep_worker(beeps):
+    while True:
+        for freq,secs in TONES[beeps.get()]:
+            winsound.Beep(freq,int(secs*1000))
+
+def load_audio():
+    audio={"waves":{},"playing":None,"beeps":None}
+    if simpleaudio is not None:
+        audio["waves"]={k:simpleaudio.WaveObject(synth(v),1,2,SAMPLE_RATE) for k,v in TONES.items()}
+    elif platform.system()=="Windows":
+        audio["beeps"]=queue.Queue(maxsize=1)
+        threading.Thread(target=beep_worker,args=(audio["beeps"],),daemon=True).start()
+    return audio
+
+def play(audio,tone):
+    wave=audio["waves"].get(tone)
+    if wave is not None:
+        try:
+            if audio["playing"] is not None:
+                audio["playing"].stop()     # newest scan wins
+            audio["playing"]=wave.play()
+        except Exception:
+            audio["waves"]={}               # no output device: stay silent
+    elif audio["beeps"] is not None:
+        try:
+            audio["beeps"].put_nowait(tone)
+        except queue.Full:
+            pass
+
+def log_scan(history,now,token,status):
+    if len(history)>=200:
+        history.pop(0)
+    history.append((now.strftime("%H:%M:%S"),token,status))
+    save_cache([now.strftime("%H:%M:%S"),token,status])
+
+def new_timings():
+    # stage -> recent durations in seconds; deque appends are atomic, so
+    # every thread records into the same dict without a lock
+    return {s:deque(maxlen=TIMING_WINDOW) for s in STAGES}
+
+def timing_summary(timings):
+    # stage -> (p50,p95) in ms, stages without samples left out
+    out={}
+    for stage,samples in timings.items():
+        values=sorted(samples)
+        if values:
+            n=len(values)
+            out[stage]=(values[n//2]*1000,values[min(n-1,int(n*0.95))]*1000)
+    return out
+
+def log_timings(summary):
+    new=not os.path.exists(TIMING_LOG)
+    with open(TIMING_LOG,"a",newline="") as f:
+        w=csv.writer(f)
+        if new:
+            w.writerow(["time"]+[f"{s}_{p}" for s in STAGES for p in ("p50","p95")])
+        w.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S")]+
+                   [f"{summary[s][i]:.1f}" if s in summary else "" for s in STAGES for i in (0,1)])
+
+def follow_stats(stats,used_local):
+    # live counters pushed by the server (/stream) instead of polling;
+    # admissions at other gates go straight into used_local so the
+    # offline check below knows about them too
+    http=requests.Session()
+    last_id=None
+    while True:
+        try:
+            headers={"Last-Event-ID":last_id} if last_id else {}
+            with http.get(f"{SERVER}/stream",headers=headers,stream=True,timeout=(2,STREAM_TIMEOUT)) as r:
+                for line in r.iter_lines(decode_unicode=True):
+                    if line and line.startswith("id:"):
+                        last_id=line[3:].strip()
+                    elif line and line.startswith("data:"):
+                        msg=json.loads(line[5:])
+                        stats.update(msg["stats"])
+                        for a in msg["admissions"]:
+                            used_local.add(a["token"])
+        except:
+            time.sleep(2)
+
+# ---------------- OFFLINE MODE ---------------- #
+# The server publishes a snapshot of the event's tokens + used flags
+# (/snapshot). Known-used tokens are refused without a round trip; when
+# the server is unreachable, unused tokens are admitted from the snapshot
+# and queued in PENDING_FILE until /scan/batch confirms them. A token the
+# server then reports as ALREADY is logged as CONFLICT.
+def load_offline():
+    offline={"snap":None,"slot":0,"pending":[],"key":None,"lock":threading.Lock()}
+    for i,path in enumerate(SNAPSHOT_FILES):
+        try:
+            snap=TokenSnapshot.open(path)
+        except (OSError,ValueError):
+            continue
+        if offline["snap"] is None or snap.epoch>offline["snap"].epoch or (
+                snap.epoch==offline["snap"].epoch and snap.version>offline["snap"].version):
+            offline["snap"],offline["slot"]=snap,i
+    if os.path.exists(PENDING_FILE):
+        with open(PENDING_FILE) as f:
+            offline["pending"]=[json.loads(line) for line in f if line.strip()]
+    if os.path.exists(TOKEN_KEY_FILE):
+        with open(TOKEN_KEY_FILE) as f:
+            offline["key"]=json.load(f)
+    return offline
+
+def fetch_token_key(offline,http):
+    # signing key of the active event (see tokens.py)
+    key=http.get(f"{SERVER}/token-key",timeout=5).json()
+    if key!=offline["key"]:
+        with open(TOKEN_KEY_FILE,"w") as f:
+            json.dump(key,f)
+        offline["key"]=key
+
+def fetch_snapshot(offline,http):
+    snap=offline["snap"]
+    headers={"If-None-Match":snap.etag} if snap else {}
+    r=http.get(f"{SERVER}/snapshot",headers=headers,timeout=5)
+    if r.status_code==304:
+        return
+    r.raise_for_status()
+    # two files in turn: the one still mapped is never overwritten
+    slot=1-offline["slot"]
+    with open(SNAPSHOT_FILES[slot],"wb") as f:
+        f.write(r.content)
+    offline["snap"],offline["slot"]=TokenSnapshot.open(SNAPSHOT_FILES[slot]),slot
+
+def queue_offline(offline,token):
+    scan={"token":token,"ts":time.time()}
+    with offline["lock"]:
+        offline["pending"].append(scan)
+        with open(PENDING_FILE,"a") as f:
+            f.write(json.dumps(scan)+"\n")
+
+def flush_offline(offline,history,http):
+    with offline["lock"]:
+        batch=offline["pending"][:SYNC_BATCH]
+    if not batch:
+        return
+    r=http.post(f"{SERVER}/scan/batch",json={"gate":GATE_ID,"scans":batch},timeout=5)
+    r.raise_for_status()
+    for res in r.json()["results"]:
+        if not res["success"]:
+            log_scan(history,datetime.now(),res["token"],"CONFLICT")
+    with offline["lock"]:
+        del offline["pending"][:len(batch)]
+        with open(PENDING_FILE,"w") as f:
+            for scan in offline["pending"]:
+                f.write(json.dumps(scan)+"\n")
+
+def sync_offline(offline,history):
+    http=requests.Session()
+    while True:
+        try:
+            fetch_token_key(offline,http)
+            fetch_snapshot(offline,http)
+            flush_offline(offline,history,http)
+        except:
+            pass
+        time.sleep(SYNC_INTERVAL)
+
+# ---------------- PIPELINE STAGES ---------------- #
+# capture_loop keeps only the newest frame, so decode and render never
+# work on stale video; decode workers and the network worker hand their
+# results back to the render loop through queues, so a slow decode or a
+# slow server costs throughput, never frames.
+def open_camera():
+    cap=cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE,1)
+    return cap
+
+def capture_loop(camera,latest,timings):
+    cap=None
+    while not camera["stop"]:
+        if cap is None or camera["restart"]:
+            if cap is not None:
+                cap.release()
+            cap=camera["open"]()
+            camera["restart"]=False
+        started=time.perf_counter()
+        ret,frame=cap.read()
+        timings["capture"].append(time.perf_counter()-started)
+        if not ret:
+            time.sleep(0.01)
+            continue
+        with latest["lock"]:
+            latest["frame"]=frame
+            latest["seq"]+=1
+    if cap is not None:
+        cap.release()
+
+def decode_worker(decode_q,found_q,cost,decoder,timings):
+    # one backend instance per thread, rebuilt when calibration switches
+    # decoder["name"]; OpenCV releases the GIL while decoding, so workers
+    # run on separate cores. cost["s"] is a running average of seconds
+    # per frame, read by the render loop to pace submissions.
+    backend=None
+    while True:
+        frame=decode_q.get()
+        if backend is None or backend.name!=decoder["name"]:
+            backend=qr_decoders.BACKENDS[decoder["name"]]()
+        started=time.perf_counter()
+        try:
+            found=backend.decode(qr_decoders.to_gray(frame))
+        except cv2.error:
+            continue
+        finally:
+            spent=time.perf_counter()-started
+            cost["s"]+=0.2*(spent-cost["s"])
+            cost["n"]+=1
+            timings["decode"].append(spent)
+        if found:
+            found_q.put(found)
+
+def motion_thumb(frame):
+    small=cv2.resize(frame,MOTION_SIZE,interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small,cv2.COLOR_BGR2GRAY) if small.ndim==3 else small
+
+def moved(prev,thumb):
+    changed=np.count_nonzero(cv2.absdiff(prev,thumb)>MOTION_DELTA)
+    return changed>MOTION_PIXELS*thumb.size
+
+def decode_interval(cost,active):
+    # still scene: a slow heartbeat; motion: as often as the CPU budget
+    # allows (every frame when decoding is cheap)
+    if not active:
+        return IDLE_DECODE
+    return cost["s"]/(DECODE_WORKERS*DECODE_BUDGET)
+
+def new_schedule():
+    return {"seq":0,"thumb":None,"motion":0,"next":0}
+
+def submit_frame(sched,frame,seq,decode_q,cost,samples):
+    # hand the newest camera frame to a free decode worker when one is
+    # due; if all are busy the frame is simply not decoded. Capture
+    # allocates a new array per frame, so workers never see it change.
+    if frame is None or seq==sched["seq"]:
+        return
+    sched["seq"]=seq
+    t=time.monotonic()
+    prev,sched["thumb"]=sched["thumb"],motion_thumb(frame)
+    if prev is None or moved(prev,sched["thumb"]):
+        sched["motion"]=t
+    active=t-sched["motion"]<MOTION_HOLD
+    if t>=sched["next"]:
+        try:
+            decode_q.put_nowait(frame)
+            sched["next"]=t+decode_interval(cost,active)
+        except queue.Full:
+            pass
+    if active:
+        samples.append(frame)
+
+def drain(q):
+    while True:
+        try:
+            yield q.get_nowait()
+        except queue.Empty:
+            return
+
+def calibrate(frames,decoder,settings):
+    # times every backend on the same recent frames and switches to the
+    # fastest reliable one; runs in its own thread
+    if decoder["busy"] or not frames:
+        return
+    decoder["busy"]=True
+    try:
+        results=qr_decoders.benchmark(frames)
+        decoder["name"]=qr_decoders.pick(results,decoder["name"])
+        decoder["results"],decoder["shown"]=results,time.time()
+        for r in results:
+            print(f"{r['backend']:<14}{r['ms']:8.1f} ms{r['hit_rate']*100:6.0f}% hits")
+        print(f"decoder: {decoder['name']}")
+        settings["decoder"]=decoder["name"]
+        save_settings(settings)
+    finally:
+        decoder["busy"]=False
+
+def net_worker(net_q,replies_q,timings):
+    # batch: [(token,wire)]; answers
+    #   ("server",batch,results)       the server's verdicts
+    #   ("offline",batch,None)         server unreachable: the request never
+    #                                  got there, the snapshot decides
+    #   ("error",batch,(status,banner)) anything else; nothing is admitted
+    # A read timeout or a broken answer may come after the server already
+    # admitted the token, so those are "rescan", never a local admission.
+    # One keep-alive session: no TCP handshake per scan. A hung server
+    # costs at most NET_TIMEOUT per request, and batches that waited out
+    # NET_DEADLINE behind it are not sent at all.
+    http=requests.Session()
+    while True:
+        batch,queued=net_q.get()
+        if time.monotonic()-queued>NET_DEADLINE:
+            replies_q.put(("error",batch,("RETRY",("SERVER BUSY - RESCAN",YELLOW))))
+            continue
+        started=time.perf_counter()
+        try:
+            r=http.post(f"{SERVER}/scan/batch",json={
+                "gate":GATE_ID,
+                "scans":[{"token":w,"ts":time.time()} for _,w in batch]
+            },timeout=NET_TIMEOUT)
+            r.raise_for_status()
+            reply=("server",batch,r.json())
+        except requests.ConnectionError:        # includes ConnectTimeout
+            reply=("offline",batch,None)
+        except requests.HTTPError as e:
+            if e.response.status_code==503:
+                reply=("error",batch,("RETRY",("SERVER BUSY - RESCAN",YELLOW)))
+            else:
+                reply=("error",batch,("SERVER",("SERVER ERROR",RED)))
+        except (requests.RequestException,ValueError):
+            reply=("error",batch,("UNKNOWN",("NO ANSWER - RESCAN",YELLOW)))
+        timings["http"].append(time.perf_counter()-started)
+        replies_q.put(reply)
+
+def triage(codes,last_seen,offline,used_local):
+    # decoded strings -> (batch for the server [(token,wire)], outcomes
+    # decided here, codes counted). Repeats within CACHE_TTL are dropped;
+    # forged / foreign and known-used codes never cost a round trip.
+    batch=[]
+    outcomes=[]
+    counted=0
+    queued=set()
+    for raw in codes:
+        wire=extract_token(raw)
+        now=time.time()
+        if not wire or now-last_seen.get(wire,0)<CACHE_TTL:
+            continue
+        last_seen[wire]=now
+        counted+=1
+
+        token=check_token(offline,wire)
+        if token is None:
+            outcomes.append((wire,"DENIED",("INVALID TOKEN",RED)))
+        elif token in used_local or lookup_offline(offline,token,used_local)=="ALREADY":
+            outcomes.append((token,"ALREADY",("ALREADY ENTERED",YELLOW)))
+        elif token not in queued:
+            queued.add(token)
+            batch.append((token,wire))
+    return batch,outcomes,counted
+
+def send_batch(net_q,held,batch):
+    # queue a batch for the network worker. A full queue only means the
+    # server is slow, not unreachable, so nothing is admitted from the
+    # snapshot here: batches wait in `held` (oldest first) and go out as
+    # the worker catches up. Call every frame, also with no new batch.
+    if batch:
+        held.append((batch,time.monotonic()))
+    while held:
+        try:
+            net_q.put_nowait(held[0])
+        except queue.Full:
+            return
+        held.pop(0)
+
+def reply_outcomes(reply,offline,used_local,stats):
+    kind,batch,j=reply
+    if kind=="offline":
+        return offline_outcomes(offline,used_local,batch)
+    if kind=="server":
+        try:
+            stats.update(j["stats"])
+            return server_outcomes(j,used_local)
+        except (KeyError,TypeError):
+            j=("UNKNOWN",("NO ANSWER - RESCAN",YELLOW))
+    status,banner=j
+    return [(token,status,banner) for token,_ in batch]
+
+def server_outcomes(j,used_local):
+    # -> [(token,status,banner)]
+    out=[]
+    for res in j["results"]:
+        token=strip_token(res["token"])
+        if res["success"]:
+            used_local.add(token)
+            out.append((token,"OK",("ENTRY ALLOWED",GREEN)))
+        else:
+            out.append((token,"DENIED",(res.get("msg","DENIED").upper(),RED)))
+    return out
+
+def offline_outcomes(offline,used_local,batch):
+    out=[]
+    for token,wire in batch:
+        local=lookup_offline(offline,token,used_local)
+        if local is None:
+            out.append((token,"SERVER",("SERVER ERROR",RED)))
+        elif local=="OK":
+            used_local.add(token)
+            queue_offline(offline,wire)
+            out.append((token,"OFFLINE",("ENTRY ALLOWED",GREEN)))
+        else:
+            msg="INVALID TOKEN" if local=="INVALID" else "ALREADY ENTERED"
+            out.append((token,"DENIED",(msg,RED)))
+    return out
+
+def lookup_offline(offline,token,used_local):
+    # "INVALID" / "ALREADY" / "OK", None without a snapshot
+    snap=offline["snap"]
+    if snap is None:
+        return None
+    found=snap.lookup(token)
+    if found is None:
+        return "INVALID"
+    if found or token in used_local:
+        return "ALREADY"
+    return "OK"
 
 def extract_token(d):
     d=d.strip()
     if d.startswith("http"):
-        return urlparse(d).path.rstrip("/").split("/")[-1]
+        path=urlparse(d).path.rstrip("/")
+        if "/scan/" not in path:
+            return None     # some other QR code (menu, wifi, ...)
+        return path.split("/")[-1]
     return d
 
+def check_token(offline,wire):
+    # plain token for local lookups, None = forged / other event.
+    # Until the key has been fetched once, leave the check to the server.
+    key=offline["key"]
+    if key is None:
+        return strip_token(wire)
+    return verify_token(wire,key.get("key"),key.get("signed_only",False))
+
 def draw_rounded_rect(img,p1,p2,color,th=-1,r=20):
     x1,y1=p1; x2,y2=p2
     cv2.rectangle(img,(x1+r,y1),(x2-r,y2),color,th)
@@ -102,11 +587,37 @@ def draw_rounded_rect(img,p1,p2,color,th=-1,r=20):
     cv2.circle(img,(x2-r,y2-r),r,color,th)
 
 def draw_text(img,t,pos,size=0.8,col=WHITE,th=2,center=False):
-    font=cv2.FONT_HERSHEY_DUPLEX
     if center:
-        s=cv2.getTextSize(str(t),font,size,th)[0]
+        s=cv2.getTextSize(str(t),FONT,size,th)[0]
         pos=(pos[0]-s[0]//2,pos[1])
-    cv2.putText(img,str(t),pos,font,size,col,th,cv2.LINE_AA)
+    cv2.putText(img,str(t),pos,FONT,size,col,th,cv2.LINE_AA)
+
+def put_text(img,cache,t,pos,size=0.8,col=WHITE,th=2,bg=CARD,center=False):
+    # draw_text for text on a flat background: rendered once per value
+    # into a small patch, then only copied while the value stays the same
+    key=(t,size,col,th,bg)
+    hit=cache.get(key)
+    if hit is None:
+        if len(cache)>=TEXT_CACHE:
+            cache.clear()
+        (w,h),base=cv2.getTextSize(t,FONT,size,th)
+        patch=np.empty((h+base+2*th,w+2*th,3),np.uint8)
+        patch[:]=bg
+        cv2.putText(patch,t,(th,h+th),FONT,size,col,th,cv2.LINE_AA)
+        hit=cache[key]=(patch,h+th)
+    patch,top=hit
+    x,y=pos[0]-th,pos[1]-top
+    if center:
+        x-=(patch.shape[1]-2*th)//2
+    # clip on all four sides: centred text wider than the space left of
+    # it starts off the frame
+    sx,sy=max(0,-x),max(0,-y)
+    h=min(patch.shape[0],img.shape[0]-y)-sy
+    w=min(patch.shape[1],img.shape[1]-x)-sx
+    if h<=0 or w<=0:
+        return
+    x,y=x+sx,y+sy
+    img[y:y+h,x:x+w]=patch[sy:sy+h,sx:sx+w]
 
 def draw_eye(img,pos,active):
     x,y=pos
@@ -115,20 +626,76 @@ def draw_eye(img,pos,active):
     cv2.circle(img,(x,y),6,col,-1)
     if not active:
         cv2.line(img,(x-20,y-12),(x+20,y+12),col,2)
+
+def build_chrome():
+    # everything that never changes, drawn once; each frame starts as a
+    # copy of this and only draws what moved
+    img=np.zeros((WIN_H,WIN_W,3),np.uint8)
+    img[:]=BG
+    draw_rounded_rect(img,(30,20),(WIN_W-30,HEADER_H+20),CARD)
+    draw_text(img,"INVITRO SCANNER",(70,95),1.8,GOLD,3)
+
+    px,vy=PANEL_X,VIDEO_Y
+    draw_rounded_rect(img,(px,vy),(px+PANEL_W,vy+VIDEO_H),CARD)
+    draw_text(img,"SYSTEM METRICS",(px+40,vy+60),0.9,GOLD,2)
+    m=vy+120
+    for a in ("Total Scans","Inside Now","Available"):
+        draw_text(img,a,(px+40,m),0.6,GRAY,1)
+        m+=60
+    draw_text(img,"RECENT ACTIVITY",(px+40,vy+350),0.8,GOLD,2)
+
+    draw_text(img,"© Invitro Entry System — Made with ❤️ by TECH NITRO",(WIN_W//2,WIN_H-20),0.6,GRAY,1,True)
+    return img
+
 def main():
     ensure_cache()
     settings=load_settings()
     keys=load_keys()
 
-    cap=cv2.VideoCapture(0)
-    detector=cv2.QRCodeDetector()
-
     stats={"total":0,"used":0,"remaining":0}
     history=[]
     history_offset=0
 
+    audio=load_audio()
+
     used_local=set()
+    offline=load_offline()
+    threading.Thread(target=follow_stats,args=(stats,used_local),daemon=True).start()
+    threading.Thread(target=sync_offline,args=(offline,history),daemon=True).start()
     last_seen={}
+    held=[]
+
+    camera={"open":open_camera,"restart":False,"stop":False}
+    latest={"lock":threading.Lock(),"frame":None,"seq":0}
+    decode_q=queue.Queue(maxsize=DECODE_WORKERS)
+    found_q=queue.Queue(maxsize=64)
+    net_q=queue.Queue(maxsize=NET_QUEUE)
+    replies_q=queue.Queue()
+    timings=new_timings()
+    capture=threading.Thread(target=capture_loop,args=(camera,latest,timings),daemon=True)
+    capture.start()
+    decode_cost={"s":0.0,"n":0}
+    name=settings["decoder"] if settings["decoder"] in qr_decoders.BACKENDS else qr_decoders.DEFAULT
+    decoder={"name":name,"results":None,"shown":0,"busy":False}
+    samples=deque(maxlen=CALIBRATION_FRAMES)
+    calibrated=False
+    for _ in range(DECODE_WORKERS):
+        threading.Thread(target=decode_worker,args=(decode_q,found_q,decode_cost,decoder,timings),daemon=True).start()
+    threading.Thread(target=net_worker,args=(net_q,replies_q,timings),daemon=True).start()
+    sched=new_schedule()
+
+    # frame buffers, allocated once
+    chrome=build_chrome()
+    canvas=np.empty_like(chrome)
+    view=np.empty((VIDEO_H,VIDEO_W,3),np.uint8)
+    texts={}
+    vx,vy,px=VIDEO_X,VIDEO_Y,PANEL_X
+
+    show_timings=False
+    timing_rows={}
+    timing_at=0
+    timing_logged=time.time()
+    frame_prev=None
 
     banner=None
     banner_time=0
@@ -151,34 +718,60 @@ def main():
     cv2.namedWindow(win,cv2.WINDOW_NORMAL)
     cv2.resizeWindow(win,WIN_W,WIN_H)
 
+    def show(token,status,new_banner):
+        nonlocal banner,banner_time
+        log_scan(history,datetime.now(),token,status)
+        banner=new_banner
+        banner_time=time.time()
+        if status in ("OK","OFFLINE"):
+            play(audio,"ok")
+        elif status=="ALREADY" or new_banner[0]=="ALREADY ENTERED":
+            play(audio,"already")
+        else:
+            play(audio,"fail")
+
     while True:
-        ret,frame=cap.read()
-        if not ret:
-            continue
+        frame_start=time.perf_counter()
+        if frame_prev is not None:
+            timings["frame"].append(frame_start-frame_prev)
+        frame_prev=frame_start
+        with latest["lock"]:
+            frame,seq=latest["frame"],latest["seq"]
 
-        canvas=np.zeros((WIN_H,WIN_W,3),np.uint8)
-        canvas[:]=BG
+        np.copyto(canvas,chrome)
 
         # -------- HEADER --------
-        draw_rounded_rect(canvas,(30,20),(WIN_W-30,HEADER_H+20),CARD)
-        draw_text(canvas,"INVITRO SCANNER",(70,95),1.8,GOLD,3)
-
         now=datetime.now()
-        draw_text(canvas,now.strftime("%H:%M:%S"),(WIN_W-300,75),1.3,WHITE,3)
-        draw_text(canvas,now.strftime("%A, %d %B %Y"),(WIN_W-300,110),0.5,GOLD,1)
+        put_text(canvas,texts,now.strftime("%H:%M:%S"),(WIN_W-300,75),1.3,WHITE,3)
+        put_text(canvas,texts,now.strftime("%A, %d %B %Y"),(WIN_W-300,110),0.5,GOLD,1)
 
         # -------- CAMERA --------
-        vx,vy=40,HEADER_H+50
-        view=cv2.resize(frame,(VIDEO_W,VIDEO_H))
-        canvas[vy:vy+VIDEO_H,vx:vx+VIDEO_W]=view
+        video=canvas[vy:vy+VIDEO_H,vx:vx+VIDEO_W]
+        resize_start=time.perf_counter()
+        if frame is not None:
+            cv2.resize(frame,(VIDEO_W,VIDEO_H),dst=view)
+            video[:]=view
+        else:
+            video[:]=0
+        resize_time=time.perf_counter()-resize_start
+
+        submit_frame(sched,frame,seq,decode_q,decode_cost,samples)
+
+        # first calibration once enough moving frames have been seen; it
+        # only switches backend if some sample held a code
+        if not calibrated and len(samples)==samples.maxlen:
+            calibrated=True
+            threading.Thread(target=calibrate,args=(list(samples),decoder,settings),daemon=True).start()
 
         # -------- SHORT SMOOTH LASER --------
+        # glow blended over the strip under the line only
         scan_y+=(scan_dir*8)
         if scan_y<=80 or scan_y>=VIDEO_H-80:
             scan_dir*=-1
-        overlay=canvas.copy()
-        cv2.line(overlay,(vx+40,vy+scan_y),(vx+VIDEO_W-40,vy+scan_y),GOLD,9)
-        cv2.addWeighted(overlay,0.20,canvas,0.80,0,canvas)
+        strip=video[scan_y-LASER_PAD:scan_y+LASER_PAD+1]
+        glow=strip.copy()
+        cv2.line(glow,(40,LASER_PAD),(VIDEO_W-40,LASER_PAD),GOLD,9)
+        strip[:]=cv2.addWeighted(glow,0.20,strip,0.80,0)
         cv2.line(canvas,(vx+40,vy+scan_y),(vx+VIDEO_W-40,vy+scan_y),GOLD,3)
 
         # -------- CORNER ANGLES --------
@@ -193,28 +786,40 @@ def main():
             cv2.line(canvas,(x,y),(x,y+ (L if y<vy+VIDEO_H//2 else -L)),GOLD,T)
 
         # -------- SIDEBAR --------
-        px=vx+VIDEO_W+30
-        draw_rounded_rect(canvas,(px,vy),(px+PANEL_W,vy+VIDEO_H),CARD)
-        draw_text(canvas,"SYSTEM METRICS",(px+40,vy+60),0.9,GOLD,2)
-
-        m=vy+120
-        for a,b in [("Total Scans",stats["total"]),
-                    ("Inside Now",stats["used"]),
-                    ("Available",stats["remaining"])]:
-            draw_text(canvas,a,(px+40,m),0.6,GRAY,1)
-            draw_text(canvas,str(b),(px+PANEL_W-110,m),0.9,WHITE,2)
-            m+=60
+        t=time.time()
+        if t-timing_at>=TIMING_REFRESH:
+            timing_rows,timing_at=timing_summary(timings),t
+        if t-timing_logged>=TIMING_LOG_INTERVAL:
+            timing_logged=t
+            try:
+                log_timings(timing_rows)
+            except OSError:
+                pass
+
+        if show_timings:
+            # stage timings in place of the counters
+            cv2.rectangle(canvas,(px+20,vy+80),(px+PANEL_W-20,vy+320),CARD,-1)
+            draw_text(canvas,"p50 / p95 ms",(px+PANEL_W-170,vy+95),0.5,GRAY,1)
+            m=vy+125
+            for s in STAGES:
+                row=timing_rows.get(s)
+                put_text(canvas,texts,s,(px+40,m),0.6,GRAY,1)
+                put_text(canvas,texts,f"{row[0]:.1f} / {row[1]:.1f}" if row else "-",(px+PANEL_W-170,m),0.6,WHITE,1)
+                m+=34
+        else:
+            m=vy+120
+            for b in (stats["total"],stats["used"],stats["remaining"]):
+                put_text(canvas,texts,str(b),(px+PANEL_W-110,m),0.9,WHITE,2)
+                m+=60
 
         # -------- HISTORY + SLIDER --------
-        draw_text(canvas,"RECENT ACTIVITY",(px+40,vy+350),0.8,GOLD,2)
-
         visible = history[-(10+history_offset):len(history)-history_offset] if history else []
 
         l=vy+400
         for h in visible[::-1]:
-            col = GREEN if h[2]=="OK" else RED if h[2]=="DENIED" else YELLOW
+            col = GREEN if h[2] in ("OK","OFFLINE") else RED if h[2]=="DENIED" else YELLOW
             cv2.circle(canvas,(px+55,l-8),6,col,-1)
-            draw_text(canvas,f"{h[0]} | {h[1]} | {h[2]}",(px+80,l),0.55,WHITE,1)
+            put_text(canvas,texts,f"{h[0]} | {h[1]} | {h[2]}",(px+80,l),0.55,WHITE,1)
             l+=30
 
         # slider bar
@@ -223,69 +828,45 @@ def main():
         bar_y=int((VIDEO_H-380)*(history_offset/max(1,total-10)))
         cv2.rectangle(canvas,(px+PANEL_W-25,vy+360+bar_y),(px+PANEL_W-10,vy+360+bar_y+bar_h),GOLD,-1)
 
-        # -------- FOOTER --------
-        draw_text(canvas,"© Invitro Entry System — Made with ❤️ by TECH NITRO",(WIN_W//2,WIN_H-20),0.6,GRAY,1,True)
-
-        # -------- QR DETECTION --------
-        try:
-            ok,dec,pts,_=detector.detectAndDecodeMulti(view)
-            tokens=[t for t in dec if t] if ok else []
-
-            if not tokens:
-                t,_=detector.detectAndDecode(view)[:2]
-                if t:
-                    tokens=[t]
-
-            for token in tokens:
-                token=extract_token(token)
-                if not token or time.time()-last_seen.get(token,0)<CACHE_TTL: 
-                    continue
-                last_seen[token]=time.time()
-                stats["total"]+=1
-
-                if len(history)>=200:
-                    history.pop(0)
-
-                if token in used_local:
-                    banner=("ALREADY ENTERED",YELLOW)
-                    history.append((now.strftime("%H:%M:%S"),token,"ALREADY"))
-                    save_cache([now.strftime("%H:%M:%S"),token,"ALREADY"])
-                    beep_fail()
-                    banner_time=time.time()
-                    break
-
-                try:
-                    r=requests.post(f"{SERVER}/scan/{token}",json={},timeout=2)
-                    j=r.json()
-                    stats.update(requests.get(f"{SERVER}/stats").json())
-                    if j.get("success"):
-                        used_local.add(token)
-                        banner=("ENTRY ALLOWED",GREEN)
-                        history.append((now.strftime("%H:%M:%S"),token,"OK"))
-                        save_cache([now.strftime("%H:%M:%S"),token,"OK"])
-                        beep_ok()
-                    else:
-                        banner=(j.get("msg","DENIED").upper(),RED)
-                        history.append((now.strftime("%H:%M:%S"),token,"DENIED"))
-                        save_cache([now.strftime("%H:%M:%S"),token,"DENIED"])
-                        beep_fail()
-                    banner_time=time.time()
-                except:
-                    banner=("SERVER ERROR",RED)
-                    history.append((now.strftime("%H:%M:%S"),token,"SERVER"))
-                    save_cache([now.strftime("%H:%M:%S"),token,"SERVER"])
-                    banner_time=time.time()
-                    beep_fail()
-        except:
-            pass
+        # -------- SCAN RESULTS --------
+        # decoded codes: dedupe + local checks here, server lookups go to
+        # the network worker as one batch per frame (group arrivals)
+        codes=[c for found in drain(found_q) for c in found]
+        batch,outcomes,counted=triage(codes,last_seen,offline,used_local)
+        stats["total"]+=counted
+        for outcome in outcomes:
+            show(*outcome)
+
+        send_batch(net_q,held,batch)
+        if batch:
+            # answer comes back through replies_q; show it's in hand
+            banner=("CHECKING...",GOLD)
+            banner_time=time.time()
+
+        for reply in drain(replies_q):
+            for outcome in reply_outcomes(reply,offline,used_local,stats):
+                show(*outcome)
+
+        # -------- DECODER CALIBRATION --------
+        if decoder["results"] and time.time()-decoder["shown"]<CALIBRATION_SHOW:
+            y=vy+VIDEO_H-40-28*len(decoder["results"])
+            for r in decoder["results"]:
+                col=GOLD if r["backend"]==decoder["name"] else WHITE
+                draw_text(canvas,f"{r['backend']}  {r['ms']:.1f} ms  {r['hit_rate']*100:.0f}% hits",(vx+40,y),0.6,col,1)
+                y+=28
 
         if banner and time.time()-banner_time<2:
             bx=vx+VIDEO_W//2
             by=vy+120
             draw_rounded_rect(canvas,(bx-260,by-50),(bx+260,by+50),banner[1])
-            draw_text(canvas,banner[0],(bx,by+20),1.2,(20,20,20),3,True)
-
-        key=cv2.waitKey(1)&0xFF
+            put_text(canvas,texts,banner[0],(bx,by+20),1.2,(20,20,20),3,banner[1],True)
+
+        # pace the UI: wait out the rest of this frame's slot
+        busy=time.perf_counter()-frame_start
+        timings["resize"].append(resize_time)
+        timings["draw"].append(busy-resize_time)
+        spare=1/RENDER_FPS-busy
+        key=cv2.waitKey(max(1,int(spare*1000)))&0xFF
         k=chr(key).lower() if key!=255 else ""
 
         def match(x):
@@ -305,9 +886,14 @@ def main():
         if match("snapshot"):
             cv2.imwrite(f"snapshot_{now.strftime('%Y%m%d_%H%M%S')}.png",canvas)
 
+        if match("timings"):
+            show_timings=not show_timings
+
+        if match("calibrate"):
+            threading.Thread(target=calibrate,args=(list(samples),decoder,settings),daemon=True).start()
+
         if match("restart"):
-            cap.release()
-            cap=cv2.VideoCapture(0)
+            camera["restart"]=True
 
         if match("admin"):
             show_admin=True
@@ -403,7 +989,8 @@ def main():
 
         cv2.imshow(win,canvas)
 
-    cap.release()
+    camera["stop"]=True
+    capture.join(1)
     cv2.destroyAllWindows()
 
 if __name__=="__main__":
@@ -1,165 +1,192 @@
-from flask import Flask, jsonify, request
-import sqlite3
-import csv
-import json
+from flask import Flask, Response, g, jsonify, request
 import sys
-from pathlib import Path
+import time
 
-# ================= APP BASE DIR =================
-def app_base_dir():
-    if getattr(sys, 'frozen', False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent
-
-BASE_DIR = app_base_dir()
+import metrics
+import scan_service
+from db_pool import reset_db_time, db_time
+from scan_service import RequestError, sse_message
+from live_feed import KEEPALIVE
+from event_registry import BASE_DIR
 
 # ================= PATHS =================
-DATA_DIR = BASE_DIR / "data"
 QRS_DIR = BASE_DIR / "qrs"
-EVENTS_FILE = DATA_DIR / "events.json"
-
-DATA_DIR.mkdir(exist_ok=True)
 QRS_DIR.mkdir(exist_ok=True)
 
-app = Flask(__name__)
-
-# ================= EVENT HELPERS =================
-def load_events():
-    if not EVENTS_FILE.exists():
-        events = {
-            "active": None,
-            "events": {}
-        }
-        save_events(events)
-    with open(EVENTS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_events(events):
-    with open(EVENTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(events, f, indent=2)
-
-def get_active_event():
-    events = load_events()
-    active = events.get("active")
-    if not active or active not in events["events"]:
-        raise RuntimeError("No active event selected")
-    return active
-
-def get_active_db():
-    return DATA_DIR / f"{get_active_event()}.db"
-
-def get_active_csv():
-    return BASE_DIR / f"{get_active_event()}_invites.csv"
-
-# ================= DB INIT =================
-def init_db():
-    db_path = get_active_db()
-    csv_path = get_active_csv()
-
-    con = sqlite3.connect(db_path)
-    cur = con.cursor()
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS invites (
-            token TEXT PRIMARY KEY,
-            used INTEGER DEFAULT 0
-        )
-    """)
-
-    # Import CSV tokens (SAFE: can be run multiple times)
-    if csv_path.exists():
-        with open(csv_path, newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            next(reader, None)  # skip header
-            for row in reader:
-                if not row:
-                    continue
-                token = row[0].strip()
-                if token:
-                    cur.execute(
-                        "INSERT OR IGNORE INTO invites(token) VALUES (?)",
-                        (token,)
-                    )
+# ================= CONFIG =================
+HOST = "127.0.0.1"
+PORT = 5000
 
-    con.commit()
-    con.close()
+app = Flask(__name__)
 
 # ================= INIT ON START =================
-try:
-    init_db()
-except RuntimeError:
-    # No active event yet → admin must create one
-    pass
-
-# ================= ROUTES =================
-@app.route("/scan/<token>", methods=["POST"])
-def scan(token):
-    con = sqlite3.connect(get_active_db())
-    cur = con.cursor()
-
-    cur.execute("SELECT used FROM invites WHERE token=?", (token,))
-    row = cur.fetchone()
+scan_service.init()
+
+# ================= METRICS =================
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    reset_db_time()
+
+@app.after_request
+def record_request(response):
+    metrics.observe_request(
+        request.endpoint or "unmatched",
+        response.status_code,
+        time.perf_counter() - g.started,
+        db_time()
+    )
+    return response
 
-    if not row:
-        con.close()
-        return jsonify(success=False, msg="Invalid token")
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(
+        scan_service.metrics_text(),
+        content_type=metrics.CONTENT_TYPE
+    )
 
-    if row[0] == 1:
-        con.close()
-        return jsonify(success=False, msg="Already entered")
+@app.errorhandler(RequestError)
+def request_error(e):
+    return jsonify(success=False, msg=e.msg), e.status
 
-    cur.execute("UPDATE invites SET used=1 WHERE token=?", (token,))
-    con.commit()
+# ================= ROUTES =================
+# Every scan / stats route also exists as /events/<event>/..., so parallel
+# sessions can be served without switching the active event.
+@app.route("/events")
+def events():
+    return jsonify(scan_service.list_events())
 
-    cur.execute("SELECT COUNT(*) FROM invites WHERE used=0")
-    remaining = cur.fetchone()[0]
+@app.route("/scan/<token>", methods=["POST"])
+@app.route("/events/<event>/scan/<token>", methods=["POST"])
+def scan(token, event=None):
+    return jsonify(scan_service.scan(token, request.args.get("gate"), event))
 
-    con.close()
-    return jsonify(success=True, remaining=remaining)
+# ================= BATCH SCAN =================
+@app.route("/scan/batch", methods=["POST"])
+@app.route("/events/<event>/scan/batch", methods=["POST"])
+def scan_batch(event=None):
+    return jsonify(scan_service.scan_batch(request.get_json(silent=True), event))
 
 @app.route("/stats")
-def stats():
-    con = sqlite3.connect(get_active_db())
-    cur = con.cursor()
-
-    cur.execute("SELECT COUNT(*) FROM invites")
-    total = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM invites WHERE used=1")
-    used = cur.fetchone()[0]
+@app.route("/events/<event>/stats")
+def stats(event=None):
+    return jsonify(scan_service.stats(event))
+
+# ================= LIVE STATS =================
+# Push instead of poll: scanners and dashboards hold one connection and
+# only receive something when an admission changes the counters.
+@app.route("/stream")
+@app.route("/events/<event>/stream")
+def stream(event=None):
+    feed = scan_service.get_store(event).feed
+    since = request.headers.get("Last-Event-ID", type=int)
+
+    def events():
+        feed.subscribe()
+        try:
+            snap = feed.snapshot(since)
+            yield sse_message(snap)
+            version = snap["version"]
+            while True:
+                snap = feed.wait(version, KEEPALIVE)
+                if snap is None:
+                    yield ": keepalive\n\n"
+                    continue
+                version = snap["version"]
+                yield sse_message(snap)
+        finally:
+            feed.unsubscribe()
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    con.close()
-    return jsonify(
-        total=total,
-        used=used,
-        remaining=total - used
+@app.route("/stats/wait")
+@app.route("/events/<event>/stats/wait")
+def stats_wait(event=None):
+    # long-poll fallback for clients that cannot read an event stream
+    return jsonify(scan_service.stats_wait(
+        request.args.get("since", type=int),
+        request.args.get("timeout", 25, type=float),
+        event
+    ))
+
+# ================= OFFLINE SNAPSHOT =================
+# Compact token list + used flags (token_snapshot.py) that scanners map
+# locally, so a gate keeps working through network blips.
+@app.route("/snapshot")
+@app.route("/events/<event>/snapshot")
+def snapshot(event=None):
+    etag, data = scan_service.snapshot(
+        request.headers.get("If-None-Match"), event
     )
+    if data is None:
+        return Response(status=304, headers={"ETag": etag})
+    return Response(
+        data,
+        mimetype="application/octet-stream",
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+@app.route("/token-key")
+@app.route("/events/<event>/token-key")
+def token_key(event=None):
+    return jsonify(scan_service.token_key(event))
 
 # ================= ADMIN DASHBOARD =================
 @app.route("/admin/dashboard")
-def admin_dashboard():
-    con = sqlite3.connect(get_active_db())
-    cur = con.cursor()
+@app.route("/events/<event>/dashboard")
+def admin_dashboard(event=None):
+    return jsonify(scan_service.dashboard(event))
+
+@app.route("/admin/activity")
+@app.route("/events/<event>/activity")
+def admin_activity(event=None):
+    return jsonify(scan_service.activity(request.args, event))
+
+@app.route("/admin/gates")
+@app.route("/events/<event>/gates")
+def admin_gates(event=None):
+    return jsonify(scan_service.gates(request.args, event))
+
+@app.route("/admin/arrivals")
+@app.route("/events/<event>/arrivals")
+def admin_arrivals(event=None):
+    return jsonify(scan_service.arrivals(request.args, event))
+
+@app.route("/admin/export")
+@app.route("/events/<event>/export")
+def admin_export(event=None):
+    content_type, filename, chunks = scan_service.export(request.args, event)
+    return Response(
+        chunks,
+        content_type=content_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-    cur.execute("SELECT COUNT(*) FROM invites")
-    total = cur.fetchone()[0]
+@app.route("/admin/pool")
+def admin_pool():
+    return jsonify(scan_service.pool_stats())
 
-    cur.execute("SELECT COUNT(*) FROM invites WHERE used=1")
-    used = cur.fetchone()[0]
+@app.route("/admin/store")
+@app.route("/events/<event>/store")
+def admin_store(event=None):
+    return jsonify(scan_service.store_stats(event))
 
-    cur.execute(
-        "SELECT token FROM invites WHERE used=1 ORDER BY rowid DESC LIMIT 20"
-    )
-    recent = [r[0] for r in cur.fetchall()]
-
-    con.close()
-    return jsonify(
-        total=total,
-        used=used,
-        remaining=total - used,
-        recent_used=recent
-    )
+@app.route("/admin/stores")
+def admin_stores():
+    return jsonify(scan_service.cache_stats())
 
 # ================= RUN =================
+# python server.py          → Flask (threaded dev server)
+# python server.py --async  → asyncio/ASGI server (needs uvicorn),
+#                             falls back to Flask if it is missing
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5000)
+    if "--async" in sys.argv:
+        import asgi_server
+        if asgi_server.run(HOST, PORT):
+            sys.exit(0)
+        print("⚠️ uvicorn not installed — falling back to Flask server")
+    app.run(host=HOST, port=PORT, threaded=True)
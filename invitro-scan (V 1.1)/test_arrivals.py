@@ -0,0 +1,84 @@
+# Per-minute arrivals rollup: kept by a trigger on admissions, backfilled
+# once for databases logged before it existed.
+import sqlite3
+
+import invite_db
+
+# ================= CONFIG =================
+T0 = 1_700_000_040          # start of a minute
+
+
+# ================= HELPERS =================
+def make_db(tmp_path):
+    con = sqlite3.connect(tmp_path / "invites.db")
+    invite_db.ensure_schema(con)
+    return con
+
+
+def log(con, entries):
+    # (ts, gate, result) straight into the log, as record_admissions does
+    con.executemany(
+        "INSERT INTO admissions(ts, gate, token, result) VALUES (?, ?, 'X', ?)",
+        entries
+    )
+    con.commit()
+
+
+def rollup(con):
+    return {
+        (minute, gate, result): count
+        for minute, gate, result, count in con.execute("SELECT * FROM arrivals")
+    }
+
+
+ENTRIES = [
+    (T0 + 1, "G1", invite_db.ADMITTED),
+    (T0 + 59.9, "G1", invite_db.ADMITTED),
+    (T0 + 30, "G2", invite_db.ADMITTED),
+    (T0 + 31, "G2", invite_db.ALREADY),
+    (T0 + 60, "G1", invite_db.ADMITTED),
+    (T0 + 200, None, invite_db.INVALID),
+]
+EXPECTED = {
+    (T0, "G1", invite_db.ADMITTED): 2,
+    (T0, "G2", invite_db.ADMITTED): 1,
+    (T0, "G2", invite_db.ALREADY): 1,
+    (T0 + 60, "G1", invite_db.ADMITTED): 1,
+    (T0 + 180, "", invite_db.INVALID): 1,
+}
+
+
+# ================= TESTS =================
+def test_trigger_counts_each_admission_in_its_minute(tmp_path):
+    con = make_db(tmp_path)
+    log(con, ENTRIES)
+    assert rollup(con) == EXPECTED
+
+
+def test_backfill_rolls_up_an_old_log_once(tmp_path):
+    con = make_db(tmp_path)
+    # a DB from before the rollup: log rows, no arrivals table / trigger
+    con.executescript("DROP TRIGGER admissions_rollup; DROP TABLE arrivals;")
+    log(con, ENTRIES)
+
+    invite_db.ensure_schema(con)
+    assert rollup(con) == EXPECTED
+
+    # later opens leave it alone, the trigger carries on from there
+    invite_db.ensure_schema(con)
+    log(con, [(T0 + 2, "G1", invite_db.ADMITTED)])
+    assert rollup(con)[(T0, "G1", invite_db.ADMITTED)] == 3
+
+
+def test_arrivals_zero_fills_the_window(tmp_path):
+    con = make_db(tmp_path)
+    log(con, ENTRIES)
+
+    got = invite_db.arrivals(con, 4, now=T0 + 200)
+
+    assert got["minutes"] == [T0, T0 + 60, T0 + 120, T0 + 180]
+    assert got["gates"] == {"G1": [2, 1, 0, 0], "G2": [1, 0, 0, 0]}
+    assert got["total"] == [3, 1, 0, 0]
+
+    everything = invite_db.arrivals(con, 4, result=None, now=T0 + 200)
+    assert everything["total"] == [4, 1, 0, 1]
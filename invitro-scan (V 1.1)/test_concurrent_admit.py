@@ -0,0 +1,97 @@
+# Run with:  python -m pytest -q test_concurrent_admit.py
+#
+# Every gate racing on the same invites must get exactly one OK per
+# token, both when admissions go straight to SQLite and when they are
+# answered by the in-memory TokenIndex.
+import csv
+import random
+import threading
+from collections import Counter
+
+import pytest
+
+import invite_db
+from db_pool import ConnectionPool
+from token_index import TokenIndex
+from tokens import make_token
+
+# ================= CONFIG =================
+GATES = 8
+TOKENS = 200
+
+
+# ================= HELPERS =================
+def make_db(tmp_path, compact):
+    tokens = [make_token() for _ in range(TOKENS)]
+    csv_path = tmp_path / "invites.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["token"])
+        writer.writerows([t] for t in tokens)
+
+    db_path = tmp_path / "invites.db"
+    pool = ConnectionPool()
+    with pool.connection(db_path) as con:
+        layout = invite_db.ensure_schema(con, compact)
+        invite_db.import_csv(con, csv_path, layout)
+    return pool, db_path, layout, tokens
+
+
+def race(admit, tokens):
+    # every gate tries every token, in its own order, all starting at once;
+    # -> token -> number of ADMITTED answers
+    start = threading.Barrier(GATES)
+    lock = threading.Lock()
+    admitted = Counter()
+    errors = []
+
+    def gate(seed):
+        order = list(tokens)
+        random.Random(seed).shuffle(order)
+        start.wait()
+        try:
+            for token in order:
+                result, _ = admit(token)
+                if result == invite_db.ADMITTED:
+                    with lock:
+                        admitted[token] += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=gate, args=(i,)) for i in range(GATES)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors, errors
+    return admitted
+
+
+# ================= TESTS =================
+@pytest.mark.parametrize("compact", [False, True], ids=["text", "int"])
+def test_sqlite_admits_each_token_once(tmp_path, compact):
+    pool, db_path, layout, tokens = make_db(tmp_path, compact)
+
+    def admit(token):
+        with pool.connection(db_path) as con:
+            return invite_db.admit(con, token, layout)
+
+    admitted = race(admit, tokens)
+    assert admitted == Counter({t: 1 for t in tokens})
+
+    with pool.connection(db_path) as con:
+        assert invite_db.read_counters(con)["used"] == TOKENS
+    pool.close_all()
+
+
+@pytest.mark.parametrize("compact", [False, True], ids=["text", "int"])
+def test_token_index_admits_each_token_once(tmp_path, compact):
+    pool, db_path, layout, tokens = make_db(tmp_path, compact)
+    with pool.connection(db_path) as con:
+        index = TokenIndex.load(con, layout)
+    pool.close_all()
+
+    admitted = race(index.admit, tokens)
+    assert admitted == Counter({t: 1 for t in tokens})
+    assert index.counters()["used"] == TOKENS
@@ -0,0 +1,61 @@
+# Trigger-maintained counters: total / used move in the same transaction
+# as the invite rows, in both token layouts.
+import sqlite3
+
+import pytest
+
+import invite_db
+from tokens import make_token
+
+
+# ================= HELPERS =================
+def make_db(tmp_path, compact, count=6):
+    con = sqlite3.connect(tmp_path / "invites.db")
+    layout = invite_db.ensure_schema(con, compact)
+    tokens = [make_token() for _ in range(count)]
+    con.executemany(layout.insert_sql, [(layout.to_key(t),) for t in tokens])
+    con.commit()
+    return con, layout, tokens
+
+
+def counters(con):
+    c = invite_db.read_counters(con)
+    return c["total"], c["used"], c["remaining"]
+
+
+# ================= TESTS =================
+@pytest.mark.parametrize("compact", [False, True], ids=["text", "int"])
+def test_counters_follow_inserts_admissions_and_deletes(tmp_path, compact):
+    con, layout, tokens = make_db(tmp_path, compact)
+    assert counters(con) == (6, 0, 6)
+
+    result, after = invite_db.admit(con, tokens[0], layout)
+    assert result == invite_db.ADMITTED
+    assert (after["total"], after["used"]) == (6, 1)
+    assert invite_db.admit(con, tokens[0], layout) == (invite_db.ALREADY, None)
+    assert invite_db.admit(con, make_token(), layout) == (invite_db.INVALID, None)
+    assert counters(con) == (6, 1, 5)
+
+    key = layout.key_column
+    con.execute(f"DELETE FROM invites WHERE {key} = ?", (layout.to_key(tokens[0]),))
+    con.execute(f"DELETE FROM invites WHERE {key} = ?", (layout.to_key(tokens[1]),))
+    con.commit()
+    assert counters(con) == (4, 0, 4)
+
+
+def test_counters_are_backfilled_for_an_old_db(tmp_path):
+    con, layout, tokens = make_db(tmp_path, False)
+    invite_db.admit(con, tokens[0], layout)
+    # a DB from before the counters: no row, no triggers
+    con.executescript("""
+        DELETE FROM counters;
+        DROP TRIGGER invites_count_insert;
+        DROP TRIGGER invites_count_delete;
+        DROP TRIGGER invites_count_used;
+    """)
+
+    invite_db.ensure_schema(con)
+    assert counters(con) == (6, 1, 5)
+
+    invite_db.admit(con, tokens[1], layout)
+    assert counters(con) == (6, 2, 4)
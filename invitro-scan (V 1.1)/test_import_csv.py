@@ -0,0 +1,86 @@
+# Incremental invite CSV import: appended rows are read from the recorded
+# offset, a rewritten file is imported again in full, and an unterminated
+# last line is imported but read again next time.
+import sqlite3
+
+import pytest
+
+import invite_db
+from tokens import make_token
+
+
+# ================= HELPERS =================
+@pytest.fixture
+def con(tmp_path):
+    con = sqlite3.connect(tmp_path / "invites.db")
+    invite_db.ensure_schema(con)
+    yield con
+    con.close()
+
+
+def write(path, text, mode="w"):
+    with open(path, mode, newline="", encoding="utf-8") as f:
+        f.write(text)
+
+
+def lines(tokens):
+    return "".join(f"{t}\n" for t in tokens)
+
+
+def stored(con):
+    return {t for t, _ in invite_db.invite_rows(con)}
+
+
+# ================= TESTS =================
+def test_unchanged_file_is_skipped(con, tmp_path):
+    path = tmp_path / "invites.csv"
+    tokens = [make_token() for _ in range(5)]
+    write(path, "token\n" + lines(tokens))
+
+    assert invite_db.import_csv(con, path) == 5
+    assert invite_db.import_csv(con, path) == 0
+    assert stored(con) == set(tokens)
+
+
+def test_appended_rows_are_read_from_the_offset(con, tmp_path):
+    path = tmp_path / "invites.csv"
+    first = [make_token() for _ in range(5)]
+    more = [make_token() for _ in range(3)]
+    write(path, "token\n" + lines(first))
+    invite_db.import_csv(con, path)
+
+    write(path, lines(more), "a")
+
+    assert invite_db.import_csv(con, path) == 3
+    assert stored(con) == set(first + more)
+    assert invite_db.read_counters(con)["total"] == 8
+
+
+def test_rewritten_prefix_triggers_a_full_reimport(con, tmp_path):
+    path = tmp_path / "invites.csv"
+    old = [make_token() for _ in range(5)]
+    new = [make_token() for _ in range(8)]
+    write(path, "token\n" + lines(old))
+    invite_db.import_csv(con, path)
+
+    # longer than before, so only the prefix hash tells it is not an append
+    write(path, "token\n" + lines(new))
+
+    assert invite_db.import_csv(con, path) == 8
+    assert stored(con) == set(old + new)
+
+
+def test_unterminated_last_line_is_read_again(con, tmp_path):
+    path = tmp_path / "invites.csv"
+    a, b, c = make_token(), make_token(), make_token()
+    write(path, f"token\n{a}\n{b}")
+
+    assert invite_db.import_csv(con, path) == 2
+    assert stored(con) == {a, b}
+
+    write(path, f"\n{c}\n", "a")
+
+    # b again (not past the recorded offset yet) plus c
+    assert invite_db.import_csv(con, path) == 2
+    assert stored(con) == {a, b, c}
+    assert invite_db.read_counters(con)["total"] == 3
@@ -0,0 +1,101 @@
+# AdmissionJournal recovery: what a crash leaves in the journal is
+# replayed into SQLite on the next start, minus a torn last line.
+import csv
+import time
+
+import invite_db
+from admission_journal import AdmissionJournal
+from db_pool import ConnectionPool
+from event_store import EventStore, encode_entry
+from tokens import make_token
+
+
+# ================= HELPERS =================
+def make_event(tmp_path, count=10):
+    tokens = [make_token() for _ in range(count)]
+    csv_path = tmp_path / "ev_invites.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["token"])
+        writer.writerows([t] for t in tokens)
+    return tmp_path / "ev.db", csv_path, tokens
+
+
+def open_store(db_path, csv_path):
+    return EventStore("ev", db_path, csv_path, ConnectionPool())
+
+
+def logged(store):
+    with store.pool.connection(store.db_path) as con:
+        return {
+            token for token, result in con.execute(
+                "SELECT token, result FROM admissions"
+            ) if result == invite_db.ADMITTED
+        }
+
+
+# ================= TESTS =================
+def test_replay_drops_a_torn_last_line(tmp_path):
+    path = tmp_path / "ev.journal"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("one\ntwo\nthr")
+    applied = []
+
+    assert AdmissionJournal.replay(path, applied.extend) == 2
+    assert applied == ["one", "two"]
+    assert not path.exists()
+
+
+def test_unmerged_entries_stay_in_the_file(tmp_path):
+    # a crash before the merge: entries are fsynced but not in SQLite
+    path = tmp_path / "ev.journal"
+    merged = []
+    journal = AdmissionJournal(path, merged.extend, merge_interval=3600)
+    seq = [journal.append(e) for e in ("a", "b", "c")][-1]
+    assert journal.wait_durable(seq, timeout=5)
+
+    replayed = []
+    assert AdmissionJournal.replay(path, replayed.extend) == 3
+    assert replayed == ["a", "b", "c"]
+    assert merged == []
+    journal.close()
+
+
+def test_admissions_survive_a_crash(tmp_path):
+    db_path, csv_path, tokens = make_event(tmp_path)
+    open_store(db_path, csv_path).close()
+
+    # what a server killed between fsync and merge leaves behind
+    now = time.time()
+    with open(db_path.with_suffix(".journal"), "w", encoding="utf-8") as f:
+        for token in tokens[:3]:
+            f.write(encode_entry(now, "G1", token, invite_db.ADMITTED) + "\n")
+        f.write(encode_entry(now, "G1", tokens[3], invite_db.ADMITTED)[:10])
+
+    store = open_store(db_path, csv_path)
+    try:
+        assert store.counters()["used"] == 3
+        assert logged(store) == set(tokens[:3])
+        assert store.admit(tokens[0])[0] == invite_db.ALREADY
+        assert store.admit(tokens[3])[0] == invite_db.ADMITTED
+    finally:
+        store.close()
+
+
+def test_admissions_survive_a_restart(tmp_path):
+    db_path, csv_path, tokens = make_event(tmp_path)
+    store = open_store(db_path, csv_path)
+    try:
+        for token in tokens[:4]:
+            assert store.admit(token, "G1")[0] == invite_db.ADMITTED
+    finally:
+        store.close()
+
+    store = open_store(db_path, csv_path)
+    try:
+        assert store.counters()["used"] == 4
+        assert logged(store) == set(tokens[:4])
+        for token in tokens[:4]:
+            assert store.admit(token)[0] == invite_db.ALREADY
+    finally:
+        store.close()
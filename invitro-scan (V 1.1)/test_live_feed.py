@@ -0,0 +1,54 @@
+import threading
+
+from live_feed import LiveFeed
+from token_index import TokenIndex
+
+# ================= CONFIG =================
+THREADS = 8
+ADMISSIONS = 2000
+
+
+def counters(used, total=10):
+    return {"total": total, "used": used, "remaining": total - used}
+
+
+# ================= TESTS =================
+def test_late_older_counters_are_not_published():
+    feed = LiveFeed(counters(0))
+    feed.publish(counters(2), [{"token": "B"}])
+    feed.publish(counters(1), [{"token": "A"}])
+
+    snap = feed.snapshot()
+    assert snap["version"] == 2
+    assert snap["stats"]["used"] == 2
+    assert [a["token"] for a in snap["admissions"]] == ["B", "A"]
+
+
+def test_used_never_goes_down_under_concurrent_admissions():
+    # the EventStore order: admit under the index lock, publish after it
+    index = TokenIndex()
+    for i in range(THREADS * ADMISSIONS):
+        index._add(f"{i:012X}")
+    feed = LiveFeed(index.counters())
+    seen = []
+    lock = threading.Lock()
+
+    def watch():
+        with lock:
+            seen.append(feed.snapshot()["stats"]["used"])
+
+    feed.add_listener(watch)
+
+    def gate(n):
+        for i in range(n * ADMISSIONS, (n + 1) * ADMISSIONS):
+            _, c = index.admit(f"{i:012X}")
+            feed.publish(c, [])
+
+    threads = [threading.Thread(target=gate, args=(n,)) for n in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert feed.snapshot()["stats"]["used"] == THREADS * ADMISSIONS
+    assert all(a <= b for a, b in zip(seen, seen[1:]))
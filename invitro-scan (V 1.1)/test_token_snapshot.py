@@ -0,0 +1,71 @@
+# Offline token snapshot: sorted keys + used flags, one binary search per
+# lookup.
+import pytest
+
+import token_snapshot
+from token_snapshot import TokenSnapshot, token_key
+from tokens import make_token
+
+# ================= CONFIG =================
+COUNT = 100
+
+
+# ================= HELPERS =================
+@pytest.fixture
+def tokens():
+    # sorted by key, so [0] / [-1] are the first / last key of a snapshot
+    return sorted((make_token() for _ in range(COUNT)), key=token_key)
+
+
+def snapshot_of(tokens, used=()):
+    return TokenSnapshot(token_snapshot.build(
+        [(t, t in used) for t in tokens], 7, 42
+    ))
+
+
+# ================= TESTS =================
+def test_hit_reports_the_used_flag(tokens):
+    used = set(tokens[::3])
+    snap = snapshot_of(tokens, used)
+
+    assert len(snap) == COUNT
+    for token in tokens:
+        assert snap.lookup(token) is (token in used)
+
+
+def test_miss(tokens):
+    snap = snapshot_of(tokens)
+    assert snap.lookup(make_token()) is None
+    assert snap.lookup("") is None
+
+
+def test_first_and_last_key(tokens):
+    snap = snapshot_of(tokens, {tokens[-1]})
+    assert snap.lookup(tokens[0]) is False
+    assert snap.lookup(tokens[-1]) is True
+
+    # keys below the first / above the last one fall off either end
+    inner = snapshot_of(tokens[1:-1])
+    assert inner.lookup(tokens[0]) is None
+    assert inner.lookup(tokens[-1]) is None
+
+
+def test_empty_snapshot():
+    snap = snapshot_of([])
+    assert len(snap) == 0
+    assert snap.lookup(make_token()) is None
+
+
+def test_open_maps_a_file(tmp_path, tokens):
+    path = tmp_path / "snapshot.bin"
+    path.write_bytes(token_snapshot.build([(t, False) for t in tokens], 7, 42))
+
+    snap = TokenSnapshot.open(path)
+    assert snap.etag == '"7-42"'
+    assert snap.lookup(tokens[COUNT // 2]) is False
+
+
+@pytest.mark.parametrize("data", [b"", b"INVSNAP1", b"NOTASNAP" + bytes(24)])
+def test_bad_data_is_refused(data):
+    with pytest.raises(ValueError):
+        TokenSnapshot(data)
@@ -0,0 +1,53 @@
+# Signed tokens: <token>-<tag>, tag = HMAC of the token under the event key.
+import pytest
+
+from tokens import TAG_LEN, make_token, new_key, sign, strip, verify
+
+
+# ================= TESTS =================
+def test_sign_verify_round_trip():
+    key = new_key()
+    token = make_token()
+    signed = sign(token, key)
+
+    assert signed.startswith(token + "-")
+    assert len(signed) == len(token) + 1 + TAG_LEN
+    assert verify(signed, key) == token
+    assert verify(signed, key, signed_only=True) == token
+    assert strip(signed) == token
+
+
+def test_wrong_key_is_rejected():
+    token = make_token()
+    signed = sign(token, new_key())
+
+    assert verify(signed, new_key()) is None
+    # signed code for an event without a key
+    assert verify(signed, None) is None
+
+
+def test_tag_of_another_token_is_rejected():
+    key = new_key()
+    other = sign(make_token(), key)
+    assert verify(make_token() + other[-TAG_LEN - 1:], key) is None
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda s: s[:-1],                       # tag too short
+    lambda s: s + "0",                      # tag too long
+    lambda s: s[:-1] + "G",                 # not hex
+    lambda s: s.lower(),                    # lower case
+    lambda s: s.replace("-", "_"),          # wrong separator
+], ids=["short", "long", "not-hex", "lower", "separator"])
+def test_malformed_tag_is_rejected(mangle):
+    key = new_key()
+    assert verify(mangle(sign(make_token(), key)), key, signed_only=True) is None
+
+
+def test_plain_tokens_pass_unless_signed_only():
+    key = new_key()
+    token = make_token()
+
+    assert verify(token, key) == token
+    assert verify(token, key, signed_only=True) is None
+    assert strip(token) == token
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+import invite_db
+
+# ================= CONFIG =================
+NEGATIVE_CACHE_SIZE = 50000
+
+
+# ================= TOKEN INDEX =================
+# token -> slot in a bytearray of used flags. Answers every scan from
+# memory; the SQLite copy is brought up to date by AdmissionJournal.
+class TokenIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._used = bytearray()
+        self._used_count = 0
+
+    @classmethod
+    def load(cls, con, layout=invite_db.TEXT_LAYOUT):
+        index = cls()
+        for token, used in invite_db.invite_rows(con, layout):
+            index._add(token, used == 1)
+        return index
+
+    def _add(self, token, used=False):
+        if token in self._slots:
+            return
+        self._slots[token] = len(self._used)
+        self._used.append(1 if used else 0)
+        if used:
+            self._used_count += 1
+
+    def _counters(self):
+        total = len(self._used)
+        return {
+            "total": total,
+            "used": self._used_count,
+            "remaining": total - self._used_count
+        }
+
+    def counters(self):
+        with self._lock:
+            return self._counters()
+
+    def admit(self, token):
+        slot = self._slots.get(token)
+        if slot is None:
+            return invite_db.INVALID, None
+
+        with self._lock:
+            if self._used[slot]:
+                return invite_db.ALREADY, None
+            self._used[slot] = 1
+            self._used_count += 1
+            return invite_db.ADMITTED, self._counters()
+
+    def admit_many(self, tokens):
+        slots = [self._slots.get(t) for t in tokens]
+        results = []
+        with self._lock:
+            for slot in slots:
+                if slot is None:
+                    results.append(invite_db.INVALID)
+                elif self._used[slot]:
+                    results.append(invite_db.ALREADY)
+                else:
+                    self._used[slot] = 1
+                    self._used_count += 1
+                    results.append(invite_db.ADMITTED)
+            return results, self._counters()
+
+    def items(self):
+        # (token, used) pairs, consistent as of one instant
+        with self._lock:
+            used = bytes(self._used)
+            slots = list(self._slots.items())
+        return [(token, used[slot]) for token, slot in slots]
+
+    def __len__(self):
+        return len(self._used)
+
+    def __contains__(self, token):
+        return token in self._slots
+
+
+# ================= NEGATIVE CACHE =================
+# Used when an event is too big for TokenIndex: remembers recent INVALID /
+# ALREADY answers so a flood of bad or repeated scans stays off the disk.
+# ALREADY never goes stale; INVALID would only if invites were added, and
+# they are imported once, when the store opens (before anything is cached).
+class NegativeCache:
+    def __init__(self, size=NEGATIVE_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+
+    def get(self, token):
+        with self._lock:
+            result = self._entries.get(token)
+            if result is not None:
+                self._entries.move_to_end(token)
+                self.hits += 1
+            return result
+
+    def put(self, token, result):
+        with self._lock:
+            self._entries[token] = result
+            self._entries.move_to_end(token)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
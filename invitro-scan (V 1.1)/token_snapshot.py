@@ -0,0 +1,77 @@
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+# ================= FORMAT =================
+# header | sorted uint64 keys (little endian) | one used byte per key
+#
+# A key is the first 8 bytes of blake2b(token): fixed width whatever the
+# token format, and a random 12-char token matching some key by accident
+# is a ~N / 2^64 event. Two invites sharing a key count as used if
+# either one is.
+MAGIC = b"INVSNAP1"
+HEADER = struct.Struct("<8sQQQ")      # magic, epoch, version, count
+
+
+def token_key(token):
+    digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def build(rows, epoch, version):
+    # rows: (token, used) pairs
+    flags = {}
+    for token, used in rows:
+        key = token_key(token)
+        flags[key] = flags.get(key, False) or bool(used)
+
+    keys = array("Q", sorted(flags))
+    used = bytes(flags[k] for k in keys)
+    if sys.byteorder != "little":
+        keys.byteswap()
+    return HEADER.pack(MAGIC, epoch, version, len(keys)) + keys.tobytes() + used
+
+
+# ================= READER =================
+# Works on any buffer; open() maps a file so a large event costs page
+# cache rather than Python objects, and a lookup is one binary search.
+class TokenSnapshot:
+    def __init__(self, buf):
+        if len(buf) < HEADER.size:
+            raise ValueError("Not a token snapshot")
+        magic, self.epoch, self.version, count = HEADER.unpack_from(buf)
+        if magic != MAGIC or len(buf) != HEADER.size + count * 9:
+            raise ValueError("Not a token snapshot")
+
+        view = memoryview(buf)
+        keys = view[HEADER.size:HEADER.size + count * 8]
+        if sys.byteorder == "little":
+            self._keys = keys.cast("Q")
+        else:
+            self._keys = array("Q", keys.tobytes())
+            self._keys.byteswap()
+        self._used = view[HEADER.size + count * 8:]
+        self._buf = buf
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @property
+    def etag(self):
+        return f'"{self.epoch}-{self.version}"'
+
+    def lookup(self, token):
+        # None = not an invite, True = already used, False = unused
+        key = token_key(token)
+        i = bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        return bool(self._used[i])
+
+    def __len__(self):
+        return len(self._keys)
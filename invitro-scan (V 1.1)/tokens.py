@@ -0,0 +1,52 @@
+import hashlib
+import hmac
+import re
+import secrets
+import uuid
+
+# ================= FORMAT =================
+# Plain token : 12 hex digits, what the invite list stores.
+# Signed token: <token>-<tag>, tag = first 8 hex digits of
+#               HMAC-SHA256(event key, token), printed on the QR only.
+#
+# The tag lets scanners and the server throw away forged, mistyped or
+# other events' codes with a CPU check, before any lookup. It filters
+# junk, it does not grant entry (the invite list does), which is why
+# the key can be handed to scanners.
+TAG_LEN = 8
+SIGNED_RE = re.compile(r"([0-9A-F]{12})-([0-9A-F]{%d})\Z" % TAG_LEN)
+
+
+def make_token():
+    return uuid.uuid4().hex[:12].upper()
+
+
+def new_key():
+    return secrets.token_hex(16)
+
+
+def tag(token, key):
+    digest = hmac.new(bytes.fromhex(key), token.encode(), hashlib.sha256)
+    return digest.hexdigest()[:TAG_LEN].upper()
+
+
+def sign(token, key):
+    return f"{token}-{tag(token, key)}"
+
+
+def strip(token):
+    # signed -> plain without checking the tag
+    m = SIGNED_RE.match(token)
+    return m.group(1) if m else token
+
+
+def verify(token, key=None, signed_only=False):
+    # -> plain token to look up, None = reject without a lookup.
+    # Legacy plain tokens pass unless the event is signed_only.
+    m = SIGNED_RE.match(token)
+    if m is None:
+        return None if signed_only else token
+    plain, got = m.groups()
+    if key is None or not hmac.compare_digest(tag(plain, key), got):
+        return None
+    return plain